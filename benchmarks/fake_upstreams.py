@@ -0,0 +1,377 @@
+"""
+Local stand-ins for Polygon REST, the Polygon websocket, yfinance and
+OpenRouter, so the server can be load-tested without API keys.
+
+Each upstream sleeps `latency` (plus up to `jitter`) seconds per request and
+fails `error_rate` of them: Polygon and OpenRouter answer 503, Yahoo 500.
+The websocket instead drops the connection on `ws_drop_rate` of its batches,
+which exercises the proxy's reconnect. Prices, bars, news and summaries are
+synthetic but deterministic per symbol.
+
+    python -m benchmarks.fake_upstreams --latency-ms 40 --error-rate 0.01
+
+prints the environment to start the server with. benchmarks/load_bench.py
+--spawn starts these servers itself.
+"""
+import argparse
+import json
+import random
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from itertools import product
+from string import ascii_uppercase
+
+from gevent import monkey
+monkey.patch_all()
+
+import gevent
+from flask import Flask, Response, jsonify, request
+from gevent.pywsgi import WSGIServer
+from geventwebsocket.handler import WebSocketHandler
+
+COMMON_TICKERS = [
+    "AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "AVGO", "JPM", "V",
+    "SPY", "QQQ", "VOO", "VTI", "DIA", "IWM", "KO", "PEP", "XOM", "JNJ",
+]
+SPAN_MS = {"minute": 60_000, "hour": 3_600_000, "day": 86_400_000}
+# Bars per page before the fake hands out a next_url, like Polygon's limit
+PAGE_BARS = 5000
+REFERENCE_PAGE = 1000
+
+
+def universe(size):
+    """
+    `size` tickers: the common ones first, then synthetic three-letter symbols.
+    """
+    synthetic = ("".join(p) for p in product(ascii_uppercase, repeat=3))
+    tickers = list(COMMON_TICKERS)
+    for sym in synthetic:
+        if len(tickers) >= size:
+            break
+        if sym not in tickers:
+            tickers.append(sym)
+    return tickers[:size]
+
+
+def base_price(symbol):
+    return 20 + zlib.crc32(symbol.encode()) % 480
+
+
+def bar(symbol, t_ms):
+    """
+    A deterministic OHLCV bar for `symbol` starting at `t_ms`.
+    """
+    rng = random.Random(f"{symbol}:{t_ms}")
+    open_ = base_price(symbol) * (1 + rng.uniform(-0.05, 0.05))
+    close = open_ * (1 + rng.uniform(-0.01, 0.01))
+    return {
+        "o": round(open_, 2),
+        "h": round(max(open_, close) * (1 + rng.uniform(0, 0.005)), 2),
+        "l": round(min(open_, close) * (1 - rng.uniform(0, 0.005)), 2),
+        "c": round(close, 2),
+        "v": rng.randint(10_000, 5_000_000),
+        "t": t_ms,
+    }
+
+
+def _last_session_ms():
+    day = datetime.now(timezone.utc).date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+class Faults:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def apply(self):
+        """
+        Sleep for the injected latency. True if this request should fail.
+        """
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            gevent.sleep(delay)
+        return random.random() < self.error_rate
+
+
+def polygon_app(faults, tickers):
+    app = Flask("fake_polygon")
+
+    @app.before_request
+    def inject():
+        if faults.apply():
+            return jsonify({"status": "ERROR", "error": "injected failure"}), 503
+
+    @app.route("/v2/aggs/ticker/<symbol>/prev")
+    def prev(symbol):
+        return jsonify({"status": "OK", "results": [{"T": symbol, **bar(symbol, _last_session_ms())}]})
+
+    @app.route("/v2/aggs/ticker/<symbol>/range/<int:multiplier>/<timespan>/<int:start>/<int:end>")
+    def aggs_range(symbol, multiplier, timespan, start, end):
+        step = multiplier * SPAN_MS.get(timespan, SPAN_MS["minute"])
+        limit = min(request.args.get("limit", PAGE_BARS, type=int), PAGE_BARS)
+        first = -(-start // step) * step
+        times = range(first, end + 1, step)
+        body = {"status": "OK", "results": [bar(symbol, t) for t in times[:limit]]}
+        if len(times) > limit:
+            body["next_url"] = (
+                f"{request.host_url}v2/aggs/ticker/{symbol}/range/{multiplier}/{timespan}/"
+                f"{times[limit]}/{end}?adjusted=true&sort=asc&limit={limit}"
+            )
+        return jsonify(body)
+
+    @app.route("/v2/aggs/grouped/locale/us/market/stocks/<day>")
+    def grouped(day):
+        t = int(datetime.fromisoformat(day).replace(tzinfo=timezone.utc).timestamp() * 1000)
+        return jsonify({"status": "OK", "results": [{"T": s, **bar(s, t)} for s in tickers]})
+
+    @app.route("/v2/snapshot/locale/us/markets/stocks/tickers")
+    def snapshot():
+        symbols = [s for s in request.args.get("tickers", "").split(",") if s]
+        t = _last_session_ms()
+        return jsonify({"status": "OK", "tickers": [{"ticker": s, "prevDay": bar(s, t)} for s in symbols]})
+
+    @app.route("/v2/reference/news")
+    def news():
+        symbol = request.args.get("ticker", "")
+        since = request.args.get("published_utc.gt")
+        # One new article per symbol per hour
+        hour = int(time.time() // 3600)
+        articles = []
+        for h in range(hour, hour - request.args.get("limit", 10, type=int), -1):
+            published = datetime.fromtimestamp(h * 3600, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            if since and published <= since:
+                break
+            articles.append({
+                "id": f"{symbol}-{h}",
+                "title": f"{symbol} update for hour {h}",
+                "description": f"Synthetic article about {symbol}.",
+                "article_url": f"https://example.com/{symbol}/{h}",
+                "published_utc": published,
+                "tickers": [symbol],
+            })
+        return jsonify({"status": "OK", "results": articles})
+
+    @app.route("/v3/reference/tickers")
+    def reference_tickers():
+        search = request.args.get("search")
+        limit = request.args.get("limit", REFERENCE_PAGE, type=int)
+        if search:
+            q = search.upper()
+            matches = [s for s in tickers if s.startswith(q)][:limit]
+            return jsonify({"status": "OK", "results": [{"ticker": s, "name": f"{s} Corp"} for s in matches]})
+        cursor = request.args.get("cursor", 0, type=int)
+        page = tickers[cursor:cursor + limit]
+        body = {"status": "OK", "results": [{"ticker": s, "name": f"{s} Corp"} for s in page]}
+        if cursor + limit < len(tickers):
+            body["next_url"] = f"{request.host_url}v3/reference/tickers?cursor={cursor + limit}&limit={limit}"
+        return jsonify(body)
+
+    @app.route("/v3/reference/tickers/<symbol>")
+    def reference_ticker(symbol):
+        return jsonify({"status": "OK", "results": {"ticker": symbol, "name": f"{symbol} Corp"}})
+
+    return app
+
+
+def yahoo_app(faults):
+    app = Flask("fake_yahoo")
+
+    @app.route("/info/<symbol>")
+    def info(symbol):
+        if faults.apply():
+            return jsonify({"error": "injected failure"}), 500
+        b = bar(symbol, _last_session_ms())
+        rng = random.Random(symbol)
+        return jsonify({
+            "symbol": symbol,
+            "longName": f"{symbol} Corp",
+            "previousClose": b["c"],
+            "open": b["o"],
+            "dayLow": b["l"],
+            "dayHigh": b["h"],
+            "bid": b["c"], "bidSize": 100,
+            "ask": round(b["c"] * 1.001, 2), "askSize": 100,
+            "fiftyTwoWeekLow": round(b["l"] * 0.7, 2),
+            "fiftyTwoWeekHigh": round(b["h"] * 1.3, 2),
+            "volume": b["v"],
+            "averageVolume": b["v"],
+            "trailingPE": round(rng.uniform(5, 60), 2),
+            "dividendYield": round(rng.uniform(0, 4), 2),
+            "beta": round(rng.uniform(0.5, 2), 2),
+        })
+
+    return app
+
+
+def openrouter_app(faults, token_delay):
+    app = Flask("fake_openrouter")
+
+    def bullets(seed):
+        rng = random.Random(seed)
+        return [f"- Synthetic point {i + 1}: {rng.choice(['strength', 'risk', 'valuation'])} note."
+                for i in range(4)]
+
+    @app.route("/api/v1/chat/completions", methods=["POST"])
+    def completions():
+        if faults.apply():
+            return jsonify({"error": {"message": "injected failure"}}), 503
+        body = request.get_json(silent=True) or {}
+        lines = bullets(json.dumps(body.get("messages"), sort_keys=True))
+        usage = {"prompt_tokens": 400, "completion_tokens": 60, "total_tokens": 460}
+        if not body.get("stream"):
+            return jsonify({"choices": [{"message": {"role": "assistant", "content": "\n".join(lines)}}],
+                            "usage": usage})
+
+        def frames():
+            for line in lines:
+                for word in line.split(" "):
+                    gevent.sleep(token_delay)
+                    yield f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n"
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': chr(10)}}]})}\n\n"
+            yield f"data: {json.dumps({'choices': [{'delta': {}}], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(frames(), content_type="text/event-stream")
+
+    return app
+
+
+class FakeStream:
+    """
+    Speaks enough of Polygon's websocket protocol for polygon.WebSocketClient:
+    status/auth handshake, `AM.` subscriptions, and one aggregate per
+    subscribed symbol every 1/rate seconds, stamped with the send time.
+    """
+
+    def __init__(self, faults, rate):
+        self.faults = faults
+        self.interval = 1.0 / rate
+
+    def __call__(self, environ, start_response):
+        ws = environ.get("wsgi.websocket")
+        if ws is None:
+            start_response("400 Bad Request", [("Content-Type", "text/plain")])
+            return [b"websocket only"]
+        self.serve(ws)
+        return []
+
+    def serve(self, ws):
+        ws.send(json.dumps([{"ev": "status", "status": "connected", "message": "Connected Successfully"}]))
+        ws.receive()
+        ws.send(json.dumps([{"ev": "status", "status": "auth_success", "message": "authenticated"}]))
+        channels = set()
+        publisher = gevent.spawn(self._publish, ws, channels)
+        try:
+            while True:
+                raw = ws.receive()
+                if raw is None:
+                    break
+                msg = json.loads(raw)
+                params = [p for p in msg.get("params", "").split(",") if p]
+                if msg.get("action") == "subscribe":
+                    channels.update(params)
+                elif msg.get("action") == "unsubscribe":
+                    channels.difference_update(params)
+        finally:
+            publisher.kill()
+
+    def _publish(self, ws, channels):
+        while True:
+            gevent.sleep(self.interval)
+            if self.faults.apply():
+                ws.close()
+                return
+            now = int(time.time() * 1000)
+            batch = []
+            for channel in list(channels):
+                if not channel.startswith("AM."):
+                    continue
+                symbol = channel[3:]
+                b = bar(symbol, now // 60_000 * 60_000)
+                batch.append({
+                    "ev": "AM", "sym": symbol, "v": b["v"], "av": b["v"] * 10,
+                    "op": b["o"], "vw": b["c"], "o": b["o"], "c": b["c"], "h": b["h"], "l": b["l"],
+                    "a": b["c"], "z": 100, "s": now - 1000, "e": now,
+                })
+            if batch:
+                ws.send(json.dumps(batch))
+
+
+def start_fakes(host="127.0.0.1", base_port=9100, latency=0.0, jitter=0.0, error_rate=0.0,
+                llm_latency=0.8, llm_token_delay=0.02, ws_rate=1.0, ws_drop_rate=0.0,
+                universe_size=2000):
+    """
+    Start all four stand-ins on `base_port + 1..4`. Returns the servers and the
+    environment that points the app at them.
+    """
+    faults = Faults(latency, jitter, error_rate)
+    llm_faults = Faults(llm_latency, jitter, error_rate)
+    ws_faults = Faults(0.0, 0.0, ws_drop_rate)
+    ports = {name: base_port + i for i, name in enumerate(("polygon", "stream", "yahoo", "openrouter"), 1)}
+    servers = [
+        WSGIServer((host, ports["polygon"]), polygon_app(faults, universe(universe_size)), log=None),
+        WSGIServer((host, ports["stream"]), FakeStream(ws_faults, ws_rate), handler_class=WebSocketHandler, log=None),
+        WSGIServer((host, ports["yahoo"]), yahoo_app(faults), log=None),
+        WSGIServer((host, ports["openrouter"]), openrouter_app(llm_faults, llm_token_delay), log=None),
+    ]
+    for server in servers:
+        server.start()
+    env = {
+        "POLYGON_API_KEY": "fake",
+        "POLYGON_BASE_URL": f"http://{host}:{ports['polygon']}",
+        "POLYGON_WS_FEED": f"{host}:{ports['stream']}",
+        "POLYGON_WS_SECURE": "false",
+        "YAHOO_INFO_URL": f"http://{host}:{ports['yahoo']}/info/{{symbol}}",
+        "OPENROUTER_API_KEY": "fake",
+        "OPENROUTER_BASE_URL": f"http://{host}:{ports['openrouter']}/api/v1",
+    }
+    return servers, env
+
+
+def add_fault_args(parser):
+    parser.add_argument("--base-port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=30, help="Polygon and Yahoo latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream requests that fail")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="OpenRouter time to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=20, help="delay between streamed words")
+    parser.add_argument("--ws-rate", type=float, default=1.0, help="aggregates per subscribed symbol per second")
+    parser.add_argument("--ws-drop-rate", type=float, default=0.0, help="fraction of batches that drop the websocket")
+    parser.add_argument("--universe", type=int, default=2000, help="tickers in the reference and grouped data")
+
+
+def fakes_from_args(args):
+    return start_fakes(
+        base_port=args.base_port,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        llm_latency=args.llm_latency_ms / 1000,
+        llm_token_delay=args.llm_token_ms / 1000,
+        ws_rate=args.ws_rate,
+        ws_drop_rate=args.ws_drop_rate,
+        universe_size=args.universe,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_fault_args(parser)
+    args = parser.parse_args()
+
+    _, env = fakes_from_args(args)
+    print(" ".join(f"{k}='{v}'" for k, v in env.items()))
+    try:
+        while True:
+            gevent.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark: per-message fan-out cost of live updates.
+
+Compares the old scan over every client's subscription set, with one emit
+per matching client, against the symbol -> sids index and per-symbol room
+emit used by server.forward_polygon_update. Both sides go through a real
+Socket.IO server, so packet encoding and the per-recipient iteration are
+measured. Engine.IO delivery is replaced by a counter, as in
+benchmarks/stream_replay.py.
+
+    python -m benchmarks.fanout_bench --clients 5000 --symbols 500 --messages 20000
+"""
+import argparse
+import random
+import time
+
+import socketio
+
+from services.subscription_index import SubscriptionIndex, symbol_room
+
+
+class DeliveryCounter:
+    """
+    Stands in for Engine.IO `send_packet`: counts packets handed to each recipient.
+    """
+
+    def __init__(self):
+        self.deliveries = 0
+
+    def send_packet(self, eio_sid, pkt):
+        self.deliveries += 1
+
+
+def build(clients, symbols, per_client):
+    universe = [f"SYM{i}" for i in range(symbols)]
+    sio = socketio.Server()
+    counter = DeliveryCounter()
+    sio.eio.send_packet = counter.send_packet
+    legacy = {}
+    index = SubscriptionIndex()
+    for n in range(clients):
+        sid = sio.manager.connect(f"eio{n}", "/")
+        for symbol in random.sample(universe, per_client):
+            legacy.setdefault(sid, set()).add(symbol)
+            index.add(sid, symbol)
+            sio.manager.enter_room(sid, "/", symbol_room(symbol))
+    return universe, sio, counter, legacy, index
+
+
+def update(symbol):
+    return {"symbol": symbol, "open": 100.0, "close": 101.0, "volume": 1200}
+
+
+def run_legacy(sio, legacy, stream):
+    emits = 0
+    for symbol in stream:
+        for sid, symbols in legacy.items():
+            if symbol in symbols:
+                sio.emit("update", update(symbol), to=sid)
+                emits += 1
+    return emits
+
+
+def run_indexed(sio, index, stream):
+    emits = 0
+    for symbol in stream:
+        if not index.has_subscribers(symbol):
+            continue
+        sio.emit("update", update(symbol), to=symbol_room(symbol))
+        emits += 1
+    return emits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--per-client", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    universe, sio, counter, legacy, index = build(args.clients, args.symbols, args.per_client)
+    stream = [random.choice(universe) for _ in range(args.messages)]
+
+    for name, fn, state in (("legacy scan", run_legacy, legacy), ("symbol index", run_indexed, index)):
+        counter.deliveries = 0
+        start = time.perf_counter()
+        emits = fn(sio, state, stream)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>13}: {args.messages / elapsed:>12,.0f} msg/s  "
+            f"{elapsed / args.messages * 1e6:>9.2f} us/msg  {emits:,} emits  "
+            f"{counter.deliveries:,} deliveries"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Load test: HTTP endpoints and Socket.IO live updates, with latency percentiles.
+
+At each concurrency level, N greenlets send a weighted mix of
+/api/stock/<symbol>, /api/stock/<symbol>/history, /api/stock/suggest and
+/api/user-data?hydrate=quotes for --duration seconds, spreading symbols
+across a skewed popularity curve. Then --sio-clients Socket.IO clients
+subscribe to live aggregates, and the run measures the lag from the moment
+the upstream stamped each aggregate to the moment a client received it.
+It prints p50/p95/p99 and requests/sec per endpoint.
+
+With --spawn, the run needs no API keys. It starts the stand-ins from
+benchmarks/fake_upstreams.py and a gunicorn server wired to them. The server
+uses a SQLite file and the Redis database in --redis-url, which is flushed
+first so each run starts cold:
+
+    python -m benchmarks.load_bench --spawn --concurrency 10,50,100 --duration 20 --json out.json
+    python -m benchmarks.load_bench --spawn --concurrency 10,50,100 --baseline out.json
+
+Without --spawn it drives --target. The target must already run with the
+environment that `python -m benchmarks.fake_upstreams` prints, and with the
+same JWT_SECRET.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import gevent
+import jwt
+import requests
+import socketio
+from gevent.pool import Pool
+
+from benchmarks.fake_upstreams import add_fault_args, fakes_from_args, universe
+
+try:
+    import websocket  # noqa: F401  (lets the Socket.IO client upgrade to websockets)
+    SIO_TRANSPORTS = ["polling", "websocket"]
+except ImportError:
+    SIO_TRANSPORTS = ["polling"]
+
+BENCH_EMAIL = "bench@example.com"
+WATCHLIST_SIZE = 20
+PERCENTILES = (50, 95, 99)
+
+# Relative share of each endpoint in the HTTP mix
+MIX = {"stock": 4, "history": 2, "suggest": 3, "user_data": 1}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(p / 100 * (len(sorted_values) - 1)))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, name, seconds, ok):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def summary(self, elapsed):
+        rows = {}
+        names = sorted(self.latencies)
+        for name in names + ["all"]:
+            values = sorted(v for n in (names if name == "all" else [name]) for v in self.latencies[n])
+            errors = sum(self.errors.values()) if name == "all" else self.errors[name]
+            rows[name] = {
+                "requests": len(values),
+                "rps": len(values) / elapsed if elapsed else 0.0,
+                "errors": errors,
+                **{f"p{p}_ms": percentile(values, p) * 1000 for p in PERCENTILES},
+            }
+        return rows
+
+
+def bench_token(secret):
+    return jwt.encode(
+        {"email": BENCH_EMAIL, "name": "Bench", "exp": datetime.utcnow() + timedelta(days=1)},
+        secret,
+        algorithm=os.getenv("JWT_ALGORITHM", "HS256"),
+    )
+
+
+class Workload:
+    """
+    Picks the next request. Symbol popularity follows 1/rank, so a few
+    symbols take most of the traffic like on the real home page.
+    """
+
+    def __init__(self, target, symbols, token, summary_mode):
+        self.target = target.rstrip("/")
+        self.symbols = symbols
+        self.weights = [1 / (rank + 1) for rank in range(len(symbols))]
+        self.token = token
+        self.summary_mode = summary_mode
+        self.kinds = list(MIX)
+        self.kind_weights = [MIX[k] for k in self.kinds]
+
+    def symbol(self):
+        return random.choices(self.symbols, self.weights)[0]
+
+    def next_request(self):
+        kind = random.choices(self.kinds, self.kind_weights)[0]
+        sym = self.symbol()
+        if kind == "stock":
+            query = "?summary=stream" if self.summary_mode == "stream" else ""
+            return kind, f"{self.target}/api/stock/{sym}{query}", None
+        if kind == "history":
+            granularity = random.choice(["5min", "1h", "1d"])
+            return kind, f"{self.target}/api/stock/{sym}/history?granularity={granularity}&max_points=500", None
+        if kind == "suggest":
+            return kind, f"{self.target}/api/stock/suggest?q={sym[:random.randint(1, len(sym))]}", None
+        return kind, f"{self.target}/api/user-data?hydrate=quotes", {"Authorization": f"Bearer {self.token}"}
+
+
+def seed_user(workload, watchlist):
+    response = requests.post(
+        f"{workload.target}/api/user-data",
+        json={"watchlist": watchlist},
+        headers={"Authorization": f"Bearer {workload.token}"},
+        timeout=30,
+    )
+    if not response.ok:
+        print(f"[load_bench] Could not seed the bench user ({response.status_code}); user-data requests will 401 or fail")
+
+
+def run_http(workload, concurrency, duration):
+    recorder = Recorder()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            kind, url, headers = workload.next_request()
+            start = time.perf_counter()
+            try:
+                ok = session.get(url, headers=headers, timeout=60).ok
+            except requests.RequestException:
+                ok = False
+            recorder.add(kind, time.perf_counter() - start, ok)
+
+    start = time.perf_counter()
+    gevent.joinall([gevent.spawn(worker) for _ in range(concurrency)])
+    return recorder.summary(time.perf_counter() - start)
+
+
+def run_socketio(target, symbols, clients, per_client, duration, token, compact):
+    """
+    Connect `clients` Socket.IO clients, subscribe each to `per_client`
+    symbols, and record connect time and update lag for `duration` seconds.
+    """
+    recorder = Recorder()
+    connected = []
+
+    def on_update(payload):
+        end_ms = payload[2] if isinstance(payload, list) else payload.get("end_timestamp")
+        if end_ms:
+            recorder.add("update_lag", time.time() - end_ms / 1000, True)
+
+    def connect(_):
+        client = socketio.Client(reconnection=False)
+        client.on("u" if compact else "update", on_update)
+        start = time.perf_counter()
+        try:
+            auth = {"token": token, "format": "compact"} if compact else {"token": token}
+            client.connect(target, auth=auth, transports=SIO_TRANSPORTS, wait_timeout=30)
+        except socketio.exceptions.ConnectionError:
+            recorder.add("connect", time.perf_counter() - start, False)
+            return
+        recorder.add("connect", time.perf_counter() - start, True)
+        for sym in random.sample(symbols, min(per_client, len(symbols))):
+            client.emit("subscribe", sym)
+        connected.append(client)
+
+    if SIO_TRANSPORTS == ["polling"]:
+        print("[load_bench] websocket-client is not installed; Socket.IO clients use long-polling")
+    Pool(50).map(connect, range(clients))
+    gevent.sleep(duration)
+    for client in connected:
+        client.disconnect()
+    for name in ("connect", "update_lag"):
+        recorder.latencies.setdefault(name, [])
+    rows = recorder.summary(duration)
+    rows.pop("all")
+    rows["update_lag"]["clients"] = len(connected)
+    return rows
+
+
+def print_rows(title, rows, baseline=None):
+    print(f"\n{title}")
+    print(f"  {'':<12}{'reqs':>8}{'req/s':>10}{'errors':>8}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+    for name, row in rows.items():
+        line = (f"  {name:<12}{row['requests']:>8}{row['rps']:>10.1f}{row['errors']:>8}"
+                + "".join(f"{row[f'p{p}_ms']:>10.1f}" for p in PERCENTILES))
+        base = (baseline or {}).get(name)
+        if base and base["rps"] and base["p95_ms"]:
+            line += (f"   vs baseline: req/s {row['rps'] / base['rps'] - 1:+.0%},"
+                     f" p95 {row['p95_ms'] / base['p95_ms'] - 1:+.0%}")
+        print(line)
+
+
+def spawn_server(args, fake_env, workdir):
+    """
+    Start gunicorn against the fake upstreams and wait until it answers.
+    """
+    import redis
+    redis.Redis.from_url(args.redis_url).flushdb()
+
+    database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    from sqlalchemy import create_engine
+    from db import UserProfile
+    UserProfile.__table__.create(create_engine(database_url), checkfirst=True)
+
+    env = {
+        **os.environ,
+        **fake_env,
+        "BIND": f"127.0.0.1:{args.port}",
+        "WEB_CONCURRENCY": str(args.workers),
+        # Several workers must share one upstream feed
+        **({"STREAM_MODE": "shared"} if args.workers > 1 else {}),
+        "DATABASE_URL": database_url,
+        "REDIS_URL": args.redis_url,
+        "JWT_SECRET": args.jwt_secret,
+    }
+    log_path = os.path.join(workdir, "server.log")
+    log = open(log_path, "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "server:app"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    print(f"[load_bench] Server log: {log_path}")
+    target = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"[load_bench] Server exited with {proc.returncode}; see {log_path}")
+        try:
+            requests.get(f"{target}/metrics", timeout=2)
+            return proc, target
+        except requests.RequestException:
+            gevent.sleep(0.5)
+    proc.terminate()
+    raise SystemExit(f"[load_bench] Server did not start; see {log_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", default="http://127.0.0.1:3000")
+    parser.add_argument("--spawn", action="store_true", help="start fake upstreams and a gunicorn server")
+    parser.add_argument("--port", type=int, default=3100, help="server port with --spawn")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers with --spawn")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15", help="flushed at start with --spawn")
+    parser.add_argument("--jwt-secret", default=os.getenv("JWT_SECRET", "load-bench-secret-not-for-production"))
+    parser.add_argument("--concurrency", default="10,50", help="comma-separated levels")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per level")
+    parser.add_argument("--symbols", type=int, default=200, help="distinct symbols requested")
+    parser.add_argument("--summary", choices=["inline", "stream"], default="stream",
+                        help="stream defers the AI summary like the web client does")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of unrecorded load first")
+    parser.add_argument("--sio-clients", type=int, default=100)
+    parser.add_argument("--sio-symbols", type=int, default=3, help="subscriptions per client")
+    parser.add_argument("--sio-duration", type=float, default=15)
+    parser.add_argument("--compact", action="store_true", help="Socket.IO clients ask for compact frames")
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--baseline", help="compare with the results of an earlier --json run")
+    add_fault_args(parser)
+    args = parser.parse_args()
+
+    random.seed(0)
+    symbols = universe(args.universe)[:args.symbols]
+    proc = None
+    if args.spawn:
+        _, fake_env = fakes_from_args(args)
+        proc, target = spawn_server(args, fake_env, tempfile.mkdtemp(prefix="load_bench-"))
+    else:
+        target = args.target
+    baseline = json.load(open(args.baseline)) if args.baseline else {}
+    token = bench_token(args.jwt_secret)
+    workload = Workload(target, symbols, token, args.summary)
+    results = {}
+
+    try:
+        seed_user(workload, symbols[:WATCHLIST_SIZE])
+        if args.warmup:
+            run_http(workload, 10, args.warmup)
+        for level in (int(c) for c in args.concurrency.split(",")):
+            rows = run_http(workload, level, args.duration)
+            key = f"http c={level}"
+            results[key] = rows
+            print_rows(f"{key}, {args.duration:.0f}s", rows, baseline.get(key))
+        if args.sio_clients:
+            rows = run_socketio(target, symbols, args.sio_clients, args.sio_symbols,
+                                args.sio_duration, token, args.compact)
+            key = f"socketio n={args.sio_clients}"
+            results[key] = rows
+            print_rows(f"{key}, {rows['update_lag']['clients']} connected, {args.sio_duration:.0f}s",
+                       rows, baseline.get(key))
+    finally:
+        if proc is not None:
+            # SIGINT is gunicorn's quick shutdown; open sockets would hold up SIGTERM
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Record the Polygon aggregate stream, and replay it through the live-update pipeline.
+
+Replayed batches go into polygon_proxy.handle_msg, then through the conflator
+and server.forward_polygon_update, and out as real Socket.IO room emits.
+Emulated clients join the rooms exactly as handle_subscribe does. Engine.IO
+delivery is replaced by a sink that counts every packet per recipient and
+times it, so the numbers cover conflation, routing, encoding and fan-out
+without any sockets.
+
+Record from the live feed (needs POLYGON_API_KEY), or set
+POLYGON_RECORD_PATH on a running server:
+
+    python -m benchmarks.stream_replay record --out stream.log.gz --symbols AAPL,MSFT,NVDA --seconds 600
+
+Replay a log at 10x, or 30 seconds of a synthetic 5000-symbol stream as fast
+as possible (--speed 0):
+
+    python -m benchmarks.stream_replay replay --log stream.log.gz --speed 10 --clients 2000
+    python -m benchmarks.stream_replay replay --synthetic 5000 --seconds 30 --speed 0 --clients 20000
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+# Import the app in single-process mode without a database or API keys
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("POLYGON_API_KEY", "replay")
+os.environ["STREAM_MODE"] = "local"
+
+import argparse
+import logging
+import random
+import threading
+import time
+
+import gevent
+from polygon.websocket.models import EquityAgg
+
+from benchmarks.fake_upstreams import bar, universe
+from benchmarks.load_bench import percentile
+from services.stream_log import StreamRecorder, read_stream_log
+from services.subscription_manager import channel_for
+
+
+def synthesize(count, rate, seconds):
+    """
+    Batches of one aggregate per symbol for `count` symbols, `rate` times a second.
+    """
+    symbols = universe(count)
+    base_ms = int(time.time() * 1000)
+    batches = []
+    for i in range(int(seconds * rate)):
+        offset = i / rate
+        end_ms = base_ms + int(offset * 1000)
+        start_ms = end_ms // 60_000 * 60_000
+        batch = []
+        for sym in symbols:
+            b = bar(sym, start_ms)
+            batch.append(EquityAgg("AM", sym, b["v"], b["v"] * 10, b["o"], b["c"], b["o"], b["c"],
+                                   b["h"], b["l"], b["c"], 100, start_ms, end_ms))
+        batches.append((offset, batch))
+    return batches
+
+
+def message_key(symbol, start_ms, end_ms):
+    return (symbol, start_ms, end_ms)
+
+
+class DeliverySink:
+    """
+    Stands in for Engine.IO `send_packet`. One room emit hands the same
+    packet to every recipient in turn, so each new packet starts a new emit.
+    For each emit we keep the time from `handle_msg` to the first and to the
+    last recipient.
+    """
+
+    def __init__(self, packet_class, injected):
+        self.packet_class = packet_class
+        self.injected = injected
+        self.deliveries = 0
+        self.emits = 0
+        self.first_lags = []
+        self.last_lags = []
+        self._packet = None
+        self._injected_at = None
+        self._last_at = None
+
+    def _finish_emit(self):
+        if self._injected_at is not None:
+            self.last_lags.append(self._last_at - self._injected_at)
+
+    def send_packet(self, eio_sid, pkt):
+        now = time.perf_counter()
+        if pkt is not self._packet:
+            self._finish_emit()
+            self._packet = pkt
+            self.emits += 1
+            event, payload = self.packet_class(encoded_packet=pkt.data).data[:2]
+            if event == "update":
+                key = message_key(payload["symbol"], payload["start_timestamp"], payload["end_timestamp"])
+            else:
+                key = message_key(*payload[:3])
+            self._injected_at = self.injected.get(key)
+            if self._injected_at is not None:
+                self.first_lags.append(now - self._injected_at)
+        self.deliveries += 1
+        self._last_at = now
+
+    def finish(self):
+        self._finish_emit()
+        self._injected_at = None
+
+
+def attach_clients(server, count, symbols, per_client, compact_share):
+    """
+    Register `count` emulated clients with the Socket.IO server, each
+    subscribed to `per_client` symbols drawn with a 1/rank popularity skew.
+    """
+    sio = server.socketio.server
+    weights = [1 / (rank + 1) for rank in range(len(symbols))]
+    for n in range(count):
+        sid = sio.manager.connect(f"replay{n}", "/")
+        compact = random.random() < compact_share
+        if compact:
+            server.compact_clients.add(sid)
+        picks = set(random.choices(symbols, weights, k=per_client))
+        for symbol in picks:
+            if compact:
+                server.compact_subscriptions.add(sid, symbol)
+            sio.manager.enter_room(sid, "/", server.symbol_room(symbol, compact=compact))
+            server.client_manager.acquire(sid, symbol)
+
+
+def replay(args):
+    import server
+    from services import polygon_proxy
+
+    # Per-subscription and per-emit log lines would swamp the report
+    logging.disable(logging.INFO)
+
+    if args.log:
+        batches = list(read_stream_log(args.log))
+    else:
+        batches = synthesize(args.synthetic, args.rate, args.seconds)
+    symbols = sorted({m.symbol for _, batch in batches for m in batch})
+    total = sum(len(batch) for _, batch in batches)
+    print(f"[stream_replay] {total:,} aggregates in {len(batches):,} batches, {len(symbols):,} symbols")
+
+    if args.conflate is not None:
+        polygon_proxy.conflator.interval = args.conflate
+    polygon_proxy.subscribe_callback(server.forward_polygon_update)
+    attach_clients(server, args.clients, symbols, args.per_client, args.compact_share)
+
+    injected = {}
+    sink = DeliverySink(server.socketio.server.packet_class, injected)
+    server.socketio.server.eio.send_packet = sink.send_packet
+
+    behind = 0.0
+    start = time.perf_counter()
+    for offset, batch in batches:
+        if args.speed > 0:
+            delay = start + offset / args.speed - time.perf_counter()
+            if delay > 0:
+                gevent.sleep(delay)
+            behind = max(behind, -delay)
+        else:
+            gevent.sleep(0)
+        now = time.perf_counter()
+        for m in batch:
+            injected[message_key(m.symbol, m.start_timestamp, m.end_timestamp)] = now
+        polygon_proxy.handle_msg(batch)
+    fed = time.perf_counter() - start
+    # Let the last conflation window flush
+    gevent.sleep(polygon_proxy.conflator.interval + 0.05)
+    sink.finish()
+    elapsed = time.perf_counter() - start
+
+    print(f"  clients {args.clients:,}, {args.per_client} subscriptions each, "
+          f"conflation {polygon_proxy.conflator.interval}s, speed {'max' if args.speed <= 0 else f'{args.speed}x'}")
+    print(f"  fed in {fed:.2f}s ({total / fed:,.0f} aggregates/s), drained in {elapsed:.2f}s"
+          + (f", at most {behind * 1000:.0f} ms behind schedule" if args.speed > 0 else ""))
+    print(f"  emits {sink.emits:,} ({sink.emits / elapsed:,.0f}/s), "
+          f"deliveries {sink.deliveries:,} ({sink.deliveries / elapsed:,.0f}/s)")
+    for name, lags in (("first recipient", sink.first_lags), ("last recipient", sink.last_lags)):
+        lags.sort()
+        print(f"  handle_msg -> {name:<16}" + "".join(
+            f"  p{p} {percentile(lags, p) * 1000:8.2f} ms" for p in (50, 95, 99)))
+
+
+def record(args):
+    from services.polygon_proxy import ws_client
+
+    recorder = StreamRecorder(args.out)
+    channels = ["AM.*"] if args.symbols == "*" else [channel_for(s.strip().upper()) for s in args.symbols.split(",")]
+    ws_client.subscribe(*channels)
+    threading.Thread(target=ws_client.run, args=(recorder.record,), daemon=True).start()
+    gevent.sleep(args.seconds)
+    recorder.close()
+    print(f"[stream_replay] Recorded {recorder.batches:,} batches to {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="record the live Polygon feed")
+    rec.add_argument("--out", required=True)
+    rec.add_argument("--symbols", default="*", help="comma-separated, or * for every ticker")
+    rec.add_argument("--seconds", type=float, default=300)
+
+    rep = commands.add_parser("replay", help="replay a log or a synthetic stream")
+    source = rep.add_mutually_exclusive_group(required=True)
+    source.add_argument("--log")
+    source.add_argument("--synthetic", type=int, metavar="SYMBOLS")
+    rep.add_argument("--rate", type=float, default=1.0, help="synthetic batches per second")
+    rep.add_argument("--seconds", type=float, default=30, help="synthetic stream length")
+    rep.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N times faster, 0 = max")
+    rep.add_argument("--clients", type=int, default=1000)
+    rep.add_argument("--per-client", type=int, default=3)
+    rep.add_argument("--compact-share", type=float, default=0.0, help="fraction of clients on compact frames")
+    rep.add_argument("--conflate", type=float, help="override STREAM_CONFLATE_SECONDS")
+    args = parser.parse_args()
+
+    random.seed(0)
+    if args.command == "record":
+        record(args)
+    else:
+        replay(args)
+
+
+if __name__ == "__main__":
+    main()
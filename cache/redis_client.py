@@ -1,2 +1,45 @@
+import os
+import time
 from redis import Redis
-redis_conn = Redis()
\ No newline at end of file
+from redis.client import Pipeline
+from dotenv import load_dotenv, find_dotenv
+
+from services.metrics import record_upstream
+
+load_dotenv(find_dotenv())
+
+
+class InstrumentedPipeline(Pipeline):
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = super().execute(raise_on_error)
+            ok = True
+            return result
+        finally:
+            record_upstream("redis", "PIPELINE", time.perf_counter() - start, ok)
+
+
+class InstrumentedRedis(Redis):
+    """
+    Redis client that times every command (labelled by command name) and
+    every pipeline round trip for /metrics.
+    """
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = super().execute_command(*args, **options)
+            ok = True
+            return result
+        finally:
+            record_upstream("redis", str(args[0]).upper(), time.perf_counter() - start, ok)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+REDIS_URL = os.getenv("REDIS_URL")
+redis_conn = InstrumentedRedis.from_url(REDIS_URL) if REDIS_URL else InstrumentedRedis()
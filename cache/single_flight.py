@@ -0,0 +1,203 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one computation. Inside a
+process, the first caller (the leader) runs the function and the others wait
+on a gevent `AsyncResult`. Across worker processes, leadership is a Redis
+`SET NX` lock holding a per-flight token: the process holding it publishes
+the JSON-encoded result under that token, and leaders in other processes
+read the token, wait on a pub/sub notification and read the hand-off key
+instead of calling upstream again. Keying the hand-off by token means a
+result left over from an earlier flight is never mistaken for the
+current one. A leader that fails
+publishes a failure marker instead, and its followers compute the value
+themselves rather than waiting out the lock.
+
+If Redis is unavailable, only the in-process coalescing applies.
+"""
+import functools
+import json
+import logging
+import time
+import uuid
+
+from gevent import Timeout
+from gevent.event import AsyncResult
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+
+logger = logging.getLogger(__name__)
+
+# Deletes the lock only if we still own it.
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Stored in the result key when the leader fails; never valid JSON.
+_FAILED = b"!failed"
+# Attempts at either taking the lock or reading the holder's token, for when
+# the leader releases it in between.
+_JOIN_ATTEMPTS = 3
+
+
+class SingleFlight:
+    def __init__(self, namespace, lock_ttl=60, result_ttl=15, redis_client=redis_conn):
+        """
+        `lock_ttl` bounds how long another process waits on a leader, and
+        `result_ttl` is how long the hand-off result stays readable in Redis.
+        """
+        self.namespace = namespace
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.redis = redis_client
+        self._inflight = {}
+        self._release = None
+
+    def _lock_key(self, key):
+        return f"sf:{self.namespace}:{key}:lock"
+
+    def _flight_keys(self, key, token):
+        """
+        Result key and done channel of the flight led under `token`.
+        """
+        base = f"sf:{self.namespace}:{key}:{token}"
+        return f"{base}:result", f"{base}:done"
+
+    def do(self, key, fn):
+        """
+        Return `fn()`, sharing the call with every concurrent caller of `key`.
+        """
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                return pending.get(timeout=self.lock_ttl)
+            except Timeout:
+                logger.warning("Timed out waiting on in-process leader for %s, computing it", key)
+                return fn()
+
+        pending = AsyncResult()
+        self._inflight[key] = pending
+        try:
+            value = self._do_across_processes(key, fn)
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _do_across_processes(self, key, fn):
+        lock_key = self._lock_key(key)
+        token = uuid.uuid4().hex
+        try:
+            leader = self._join(lock_key, token)
+        except RedisError as e:
+            logger.warning("Redis unavailable, coalescing in-process only: %s", e)
+            return fn()
+
+        if leader != token:
+            if leader is not None:
+                found, value = self._wait_for_leader(*self._flight_keys(key, leader))
+                if found:
+                    return value
+            # Leader failed or timed out: compute it ourselves.
+            return fn()
+
+        result_key, channel = self._flight_keys(key, token)
+        handed_off = False
+        try:
+            value = fn()
+            try:
+                self.redis.set(result_key, json.dumps(value, default=str), ex=self.result_ttl)
+                self.redis.publish(channel, "1")
+                handed_off = True
+            except (RedisError, TypeError, ValueError) as e:
+                logger.warning("Could not hand off result for %s: %s", key, e)
+            return value
+        finally:
+            if not handed_off:
+                # fn() raised (or the result could not be stored): release the
+                # followers now instead of leaving them to wait out lock_ttl.
+                try:
+                    self.redis.set(result_key, _FAILED, ex=self.result_ttl)
+                    self.redis.publish(channel, "0")
+                except RedisError as e:
+                    logger.warning("Could not publish failure for %s: %s", key, e)
+            try:
+                if self._release is None:
+                    self._release = self.redis.register_script(_RELEASE_LOCK)
+                self._release(keys=[lock_key], args=[token])
+            except RedisError as e:
+                logger.warning("Could not release lock for %s: %s", key, e)
+
+    def _join(self, lock_key, token):
+        """
+        Take the lock with `token`, or return the current holder's token.
+        None if neither worked, because leaders kept releasing it in between.
+        """
+        for _ in range(_JOIN_ATTEMPTS):
+            if self.redis.set(lock_key, token, nx=True, ex=self.lock_ttl):
+                return token
+            leader = self.redis.get(lock_key)
+            if leader is not None:
+                return leader.decode()
+        return None
+
+    def _read_result(self, result_key):
+        """
+        `(found, value)`; `found` is None while the leader is still running
+        and False once it has failed.
+        """
+        raw = self.redis.get(result_key)
+        if raw is None:
+            return None, None
+        if raw == _FAILED:
+            return False, None
+        return True, json.loads(raw)
+
+    def _wait_for_leader(self, result_key, channel):
+        pubsub = None
+        try:
+            pubsub = self.redis.pubsub()
+            pubsub.subscribe(channel)
+            # The leader may have finished before we subscribed.
+            found, value = self._read_result(result_key)
+            if found is not None:
+                return found, value
+            deadline = time.monotonic() + self.lock_ttl
+            while time.monotonic() < deadline:
+                # Returns None for the subscribe ack as well as on timeout.
+                remaining = deadline - time.monotonic()
+                if pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining) is not None:
+                    break
+            return self._read_result(result_key)
+        except (RedisError, ValueError) as e:
+            logger.warning("Waiting on leader failed: %s", e)
+            return False, None
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except RedisError:
+                    pass
+
+
+def single_flight(namespace, key, **options):
+    """
+    Decorator form: `key(*args, **kwargs)` builds the coalescing key.
+    """
+    flight = SingleFlight(namespace, **options)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return flight.do(key(*args, **kwargs), lambda: fn(*args, **kwargs))
+        wrapper.flight = flight
+        return wrapper
+    return decorator
@@ -0,0 +1,149 @@
+"""
+Versioned cache for AI stock summaries.
+
+Keys combine the symbol, the prompt version and a fingerprint of the input
+metrics, so a summary is regenerated only when the prompt or the underlying
+fundamentals change. The fingerprint covers only an allow-list of
+fundamentals that do not move with the share price (beta, margins, expense
+ratio, name, sector), rounded to two significant figures, so price movement
+does not invalidate it.
+
+Values are stored as UTF-8 JSON bytes, which is binary-safe and does not
+depend on `decode_responses`. Each entry has a hard TTL and is refreshed
+early with probability rising towards expiry (the "XFetch" rule), so popular
+summaries are rebuilt before they lapse instead of all at once. A cold miss
+is coalesced by a per-key single-flight lock. An early refresh runs in the
+background, and every caller, including the one that started it, gets the
+cached summary.
+"""
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import time
+
+import gevent
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+from cache.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Inputs that identify a summary. Everything else (quotes, ranges, PE, yield,
+# market cap, returns, volume) is derived from the price and left out.
+FUNDAMENTAL_FIELDS = {
+    # services.yahoo_client.map_yahoo_overview
+    "Beta (5Y Monthly)", "Expense Ratio (net)",
+    # monthly_update.fetch_overview
+    "name", "sic_description", "beta", "profit_margin", "Beta", "ProfitMargin",
+}
+
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+
+
+def _coarse(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(f"{value:.2g}")
+    if isinstance(value, str):
+        return _NUMBER_RE.sub(lambda m: f"{float(m.group()):.2g}", value)
+    return str(value)
+
+
+def fingerprint(metrics: dict) -> str:
+    stable = {k: _coarse(v) for k, v in metrics.items() if k in FUNDAMENTAL_FIELDS}
+    blob = json.dumps(stable, sort_keys=True, default=str).encode()
+    return hashlib.sha1(blob).hexdigest()[:16]
+
+
+class SummaryCache:
+    def __init__(self, prompt_version, ttl=7 * 24 * 3600, beta=1.0, redis_client=redis_conn):
+        self.prompt_version = prompt_version
+        self.ttl = ttl
+        self.beta = beta
+        self.redis = redis_client
+        self.flight = SingleFlight("summary", lock_ttl=120, redis_client=redis_client)
+
+    def key(self, symbol, metrics):
+        return f"summary:v{self.prompt_version}:{str(symbol).upper()}:{fingerprint(metrics)}"
+
+    def _read(self, key):
+        try:
+            raw = self.redis.get(key)
+        except RedisError as e:
+            logger.warning("Redis unavailable for get: %s", e)
+            return None
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw.decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            return None
+
+    def _write(self, key, value, delta):
+        entry = {"value": value, "delta": delta, "expiry": time.time() + self.ttl}
+        try:
+            self.redis.set(key, json.dumps(entry).encode("utf-8"), ex=self.ttl)
+        except RedisError as e:
+            logger.warning("Redis unavailable for set: %s", e)
+
+    def _due_for_refresh(self, entry):
+        # XFetch: refresh early with a probability that grows as expiry nears,
+        # scaled by how long the value took to compute.
+        jitter = -entry.get("delta", 1.0) * self.beta * math.log(random.random() or 1e-12)
+        return time.time() + jitter >= entry.get("expiry", 0)
+
+    def _generate(self, key, generate):
+        start = time.time()
+        value = generate()
+        if value:
+            self._write(key, value, time.time() - start)
+        return value
+
+    def _refresh(self, key, generate):
+        try:
+            self._generate(key, generate)
+        except Exception as e:
+            logger.exception("Background refresh failed for %s: %s", key, e)
+
+    def peek(self, symbol, metrics):
+        """
+        Return the cached summary, or None. Never generates.
+        """
+        entry = self._read(self.key(symbol, metrics))
+        return entry["value"] if entry is not None else None
+
+    def generate(self, symbol, metrics, generate):
+        """
+        Run `generate()` for this key under the single-flight lock and cache the result.
+        """
+        key = self.key(symbol, metrics)
+        return self.flight.do(key, lambda: self._generate(key, generate))
+
+    def get_or_generate(self, symbol, metrics, generate):
+        """
+        Return the cached summary for `(symbol, metrics)`, calling `generate()`
+        when it is missing. An entry due for refresh is returned as-is while
+        one caller regenerates it in the background. Falsy results are not cached.
+        """
+        key = self.key(symbol, metrics)
+        entry = self._read(key)
+        if entry is not None and not self._due_for_refresh(entry):
+            return entry["value"]
+
+        if entry is not None:
+            # Early refresh: the caller that claims it regenerates in the background.
+            # The claim is left to expire, which also spaces out retries on failure.
+            try:
+                claimed = self.redis.set(f"{key}:refresh", "1", nx=True, ex=120)
+            except RedisError:
+                claimed = False
+            if claimed:
+                gevent.spawn(self._refresh, key, generate)
+            return entry["value"]
+
+        return self.generate(symbol, metrics, generate)
@@ -0,0 +1,136 @@
+"""
+Two-tier (in-process LRU -> Redis) cache with stale-while-revalidate.
+
+Entries carry two deadlines. Before `fresh_until` they are served as-is.
+Between `fresh_until` and `stale_until` they are still served immediately,
+and a background greenlet refreshes them. After `stale_until` the caller
+fetches synchronously. How long each deadline lasts depends on the entry's
+field class (see `policies`).
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+
+import gevent
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCache:
+    def __init__(self, namespace, policies, max_local_entries=512, redis_client=redis_conn, ttl_scale=None):
+        """
+        `policies` maps a field class to `(fresh_seconds, stale_seconds)`.
+        `fresh_seconds` may be a callable for deadlines that are not a fixed
+        interval, e.g. "until the next market session". `ttl_scale`, if given,
+        is called as `ttl_scale(field_class, key)` and multiplies the fresh
+        period of each write.
+        """
+        self.namespace = namespace
+        self.policies = policies
+        self.ttl_scale = ttl_scale
+        self.max_local_entries = max_local_entries
+        self.redis = redis_client
+        self._local = OrderedDict()
+        self._refreshing = set()
+
+    def _key(self, field_class, key):
+        return f"{self.namespace}:{field_class}:{key}"
+
+    def _ttls(self, field_class, key=None):
+        fresh, stale = self.policies[field_class]
+        if callable(fresh):
+            fresh = fresh()
+        if self.ttl_scale is not None and key is not None:
+            fresh *= self.ttl_scale(field_class, key)
+        return max(int(fresh), 1), int(stale)
+
+    def _remember(self, rkey, entry):
+        self._local[rkey] = entry
+        self._local.move_to_end(rkey)
+        while len(self._local) > self.max_local_entries:
+            self._local.popitem(last=False)
+
+    def _read_redis(self, rkey):
+        try:
+            raw = self.redis.get(rkey)
+        except RedisError as e:
+            logger.warning("Redis unavailable for get %s: %s", rkey, e)
+            return None
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _read(self, rkey, now):
+        entry = self._local.get(rkey)
+        if entry is not None:
+            if now < entry["stale_until"]:
+                self._local.move_to_end(rkey)
+                return entry
+            self._local.pop(rkey, None)
+        entry = self._read_redis(rkey)
+        if entry is not None:
+            self._remember(rkey, entry)
+        return entry
+
+    def _write(self, rkey, field_class, value, key=None):
+        fresh, stale = self._ttls(field_class, key)
+        now = time.time()
+        entry = {"value": value, "fresh_until": now + fresh, "stale_until": now + fresh + stale}
+        self._remember(rkey, entry)
+        try:
+            self.redis.set(rkey, json.dumps(entry, default=str), ex=fresh + stale)
+        except RedisError as e:
+            logger.warning("Redis unavailable for set %s: %s", rkey, e)
+
+    def _refresh(self, rkey, field_class, key, fetch):
+        try:
+            # Another process may already have refreshed the shared tier.
+            entry = self._read_redis(rkey)
+            if entry is not None and time.time() < entry["fresh_until"]:
+                self._remember(rkey, entry)
+                return
+            value = fetch()
+            if value:
+                self._write(rkey, field_class, value, key)
+        except Exception as e:
+            logger.exception("Background refresh failed for %s: %s", rkey, e)
+        finally:
+            self._refreshing.discard(rkey)
+
+    def peek(self, field_class, key):
+        """
+        "fresh", "stale" or None for `key`, without fetching or refreshing.
+        """
+        now = time.time()
+        entry = self._read(self._key(field_class, key), now)
+        if entry is None or now >= entry["stale_until"]:
+            return None
+        return "fresh" if now < entry["fresh_until"] else "stale"
+
+    def get_or_fetch(self, field_class, key, fetch):
+        """
+        Return the cached value for `key`, calling `fetch()` on a miss.
+
+        Falsy results are returned but not cached, so a failed upstream call
+        is retried on the next request instead of being pinned.
+        """
+        rkey = self._key(field_class, key)
+        now = time.time()
+        entry = self._read(rkey, now)
+        if entry is not None and now < entry["stale_until"]:
+            if now >= entry["fresh_until"] and rkey not in self._refreshing:
+                self._refreshing.add(rkey)
+                gevent.spawn(self._refresh, rkey, field_class, key, fetch)
+            return entry["value"]
+
+        value = fetch()
+        if value:
+            self._write(rkey, field_class, value, key)
+        return value
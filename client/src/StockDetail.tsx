@@ -11,7 +11,8 @@ interface StockData {
   market_cap?: number;
   pe_ratio?: number;
   dividend_yield?: number;
-  ai_summary?: string[];
+  ai_summary?: string[] | null;
+  ai_summary_stream?: string;
   news?: {
     title: string;
     summary: string;
@@ -100,7 +101,7 @@ const StockDetail: React.FC = () => {
   useEffect(() => {
     const fetchAllGranularities = async () => {
       try {
-        const metaRes = await fetch(`${import.meta.env.VITE_API_URL}/api/stock/${symbol}`);
+        const metaRes = await fetch(`${import.meta.env.VITE_API_URL}/api/stock/${symbol}?summary=stream`);
         const meta = await metaRes.json();
 
         if (!meta.error) {
@@ -133,6 +134,22 @@ const StockDetail: React.FC = () => {
     }
   }, [symbol, selectedGranularity, marketStatus]);
 
+  // Stream the AI summary bullet by bullet when it was not cached yet
+  const summaryStream = stock?.ai_summary_stream;
+  useEffect(() => {
+    if (!summaryStream) return;
+
+    const source = new EventSource(`${import.meta.env.VITE_API_URL}${summaryStream}`);
+    source.addEventListener('bullet', (e) => {
+      const bullet = JSON.parse((e as MessageEvent).data) as string;
+      setStock(prev => prev ? { ...prev, ai_summary: [...(prev.ai_summary ?? []), bullet] } : prev);
+    });
+    const close = () => source.close();
+    source.addEventListener('done', close);
+    source.onerror = close;
+    return close;
+  }, [summaryStream]);
+
   useEffect(() => {
     if (!chartContainerRef.current || !historyCache[selectedGranularity] || historyCache[selectedGranularity].length === 0) return;
 
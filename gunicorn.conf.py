@@ -0,0 +1,36 @@
+# Multi-worker deployment with one shared Polygon feed:
+#
+#   STREAM_MODE=shared REDIS_URL=redis://... gunicorn -c gunicorn.conf.py server:app
+#
+# Every worker (on every host) serves Socket.IO clients; one of them is elected
+# to own the Polygon websocket and publishes aggregates through Redis.
+# In the default local mode each process opens its own websocket, so only a
+# single worker is allowed.
+import os
+
+STREAM_MODE = os.getenv("STREAM_MODE", "local")
+
+bind = os.getenv("BIND", "0.0.0.0:3000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4" if STREAM_MODE == "shared" else "1"))
+worker_class = "geventwebsocket.gunicorn.workers.GeventWebSocketWorker"
+
+
+def on_starting(server):
+    # Checked here rather than above so a -w/--workers flag is covered too
+    if STREAM_MODE != "shared" and server.cfg.workers > 1:
+        raise RuntimeError(
+            f"STREAM_MODE={STREAM_MODE} opens one Polygon websocket per worker; "
+            f"set STREAM_MODE=shared (with REDIS_URL) to run {server.cfg.workers} workers"
+        )
+
+
+def child_exit(server, worker):
+    # Drop a dead worker's metric files when /metrics aggregates across workers
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    from server import start_background_jobs
+    start_background_jobs()
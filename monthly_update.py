@@ -1,31 +1,85 @@
+from gevent import monkey
+monkey.patch_all()
+
 import os
 import json
 import time
 import pickle
+import argparse
+from gevent.pool import Pool
+from gevent.lock import BoundedSemaphore
 from dotenv import load_dotenv, find_dotenv
 from apscheduler.schedulers.blocking import BlockingScheduler
-from services.summary_generator import generate_ai_summary
+from services.summary_generator import SUMMARY_UNAVAILABLE, generate_ai_summary
 from services.financials import interpret_financials
+from services.yahoo_client import fetch_yf_info
+from services.polygon_client import polygon
 from cache.redis_client import redis_conn
+from services.log_config import configure_logging
 
 load_dotenv(find_dotenv())
 
-POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
-
 TICKER_FILE = "cached_tickers.json"
 UPDATE_LOG = "last_update.log"
 
+# Redis bookkeeping: per-run checkpoint set and last refresh time per symbol
+CHECKPOINT_KEY = "monthly_update:{run_id}:done"
+UPDATED_AT_KEY = "monthly_update:updated_at"
+CHECKPOINT_TTL = 40 * 24 * 3600
+STALE_AFTER = 25 * 24 * 3600
+
+# Results are written to Redis in pipelined batches of this size
+WRITE_BATCH = 25
+
+# Separate limits: market-data calls are cheap and parallel, LLM calls are not
+market_slots = BoundedSemaphore(int(os.getenv("UPDATE_MARKET_CONCURRENCY", "16")))
+llm_slots = BoundedSemaphore(int(os.getenv("UPDATE_LLM_CONCURRENCY", "4")))
+
+def fetch_overview(symbol):
+    """Polygon reference details merged with yfinance fundamentals."""
+    with market_slots:
+        try:
+            details = polygon.get_json(
+                f"/v3/reference/tickers/{symbol}", endpoint="reference.ticker"
+            ).get("results", {}) or {}
+        except Exception as e:
+            print(f"⚠️ Polygon details failed for {symbol}: {e}")
+            details = {}
+        info = fetch_yf_info(symbol)
+
+    if not details and not info:
+        return None
+    return {
+        "name": details.get("name") or info.get("longName"),
+        "sic_description": details.get("sic_description") or info.get("sector"),
+        "market_cap": details.get("market_cap") or info.get("marketCap") or 0,
+        "pe_ratio": info.get("trailingPE"),
+        "beta": info.get("beta"),
+        "dividend_yield": info.get("dividendYield"),
+        "profit_margin": info.get("profitMargins"),
+        # Keys interpret_financials looks for
+        "dividendYield": info.get("dividendYield"),
+        "PERatio": info.get("trailingPE"),
+        "Beta": info.get("beta"),
+        "ProfitMargin": info.get("profitMargins"),
+    }
+
 def fetch_stock_data(symbol):
     try:
         print(f"\n📈 Updating {symbol}...")
 
-        overview = #IMPLEMENT
+        overview = fetch_overview(symbol)
 
         if not overview:
             print(f"❌ Incomplete data for {symbol}. Skipping.")
             return None
 
-        summary = generate_ai_summary(overview)
+        with llm_slots:
+            summary = generate_ai_summary(overview, symbol)
+        if summary == SUMMARY_UNAVAILABLE:
+            # Not written or checkpointed, so the next run retries it
+            print(f"❌ No AI summary for {symbol}. Skipping.")
+            return None
         fin_summary = interpret_financials(overview)
 
         category_tags = []
@@ -36,7 +90,7 @@ def fetch_stock_data(symbol):
         if 'low_beta' in fin_summary or 'low_pe' in fin_summary:
             category_tags.append("Blue Chips")
 
-        response_data = {
+        return {
             'symbol': symbol.upper(),
             'name': overview.get("name", "N/A"),
             'sector': overview.get("sic_description", "N/A"),
@@ -50,28 +104,65 @@ def fetch_stock_data(symbol):
             'source': 'recommended'
         }
 
-        redis_conn.set(symbol, pickle.dumps(response_data))
-        return True
-
     except Exception as e:
         print(f"Error updating {symbol}: {e}")
-        return False
-
-def update_all_tickers():
-    print("\n📅 Starting monthly update job (AI summaries and metadata)...")
+        return None
 
+def load_tickers():
     if not os.path.exists(TICKER_FILE):
         print(f"❌ Ticker file not found: {TICKER_FILE}")
+        return []
+    with open(TICKER_FILE, "r") as f:
+        return [entry["symbol"].upper() for entry in json.load(f)]
+
+def pending_symbols(symbols, run_id, only_stale):
+    """Drop symbols already checkpointed in this run, and fresh ones with --only-stale."""
+    done = {s.decode() for s in redis_conn.smembers(CHECKPOINT_KEY.format(run_id=run_id))}
+    todo = [s for s in symbols if s not in done]
+    if only_stale and todo:
+        now = time.time()
+        stamps = redis_conn.hmget(UPDATED_AT_KEY, todo)
+        todo = [s for s, ts in zip(todo, stamps) if ts is None or now - float(ts) > STALE_AFTER]
+    return todo
+
+def flush_results(results, run_id):
+    """Write a batch of results and their checkpoints in one round trip."""
+    if not results:
+        return
+    now = time.time()
+    checkpoint = CHECKPOINT_KEY.format(run_id=run_id)
+    pipe = redis_conn.pipeline(transaction=False)
+    for data in results:
+        pipe.set(data['symbol'], pickle.dumps(data))
+        pipe.hset(UPDATED_AT_KEY, data['symbol'], now)
+        pipe.sadd(checkpoint, data['symbol'])
+    pipe.expire(checkpoint, CHECKPOINT_TTL)
+    pipe.execute()
+    results.clear()
+
+def update_all_tickers(only_stale=False, concurrency=None, run_id=None):
+    print("\n📅 Starting monthly update job (AI summaries and metadata)...")
+
+    symbols = load_tickers()
+    if not symbols:
         return
 
-    with open(TICKER_FILE, "r") as f:
-        tickers = json.load(f)
+    # One checkpoint set per calendar month, so a rerun resumes where it stopped
+    run_id = run_id or time.strftime("%Y-%m")
+    todo = pending_symbols(symbols, run_id, only_stale)
+    print(f"🔁 {len(symbols) - len(todo)} of {len(symbols)} tickers already done or fresh; {len(todo)} to update.")
 
+    pool = Pool(concurrency or int(os.getenv("UPDATE_CONCURRENCY", "16")))
+    batch = []
     count = 0
-    for entry in tickers:
-        symbol = entry["symbol"].upper()
-        if fetch_stock_data(symbol):
-            count += 1
+    for data in pool.imap_unordered(fetch_stock_data, todo):
+        if not data:
+            continue
+        batch.append(data)
+        count += 1
+        if len(batch) >= WRITE_BATCH:
+            flush_results(batch, run_id)
+    flush_results(batch, run_id)
 
     with open(UPDATE_LOG, "w") as f:
         f.write(f"Last monthly update: {time.ctime()}\nUpdated {count} tickers.")
@@ -83,5 +174,17 @@ scheduler = BlockingScheduler()
 scheduler.add_job(update_all_tickers, 'cron', day=1, hour=0, minute=0)
 
 if __name__ == "__main__":
-    print("🕓 Scheduler started. Monthly job scheduled for 00:00 on day 1.")
-    scheduler.start()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Refresh cached AI summaries and metadata.")
+    parser.add_argument("--now", action="store_true", help="run once immediately instead of scheduling")
+    parser.add_argument("--only-stale", action="store_true", help="skip tickers refreshed within the last 25 days")
+    parser.add_argument("--concurrency", type=int, help="symbols processed at once")
+    parser.add_argument("--run-id", help="checkpoint namespace (defaults to the current month)")
+    args = parser.parse_args()
+    # Service modules log instead of printing; show them on the console too
+    configure_logging()
+
+    if args.now:
+        update_all_tickers(only_stale=args.only_stale, concurrency=args.concurrency, run_id=args.run_id)
+    else:
+        print("🕓 Scheduler started. Monthly job scheduled for 00:00 on day 1.")
+        scheduler.start()
@@ -0,0 +1,37 @@
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+from gevent.pool import Pool
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+from cache.redis_client import redis_conn
+from services.log_config import configure_logging
+from services.investor_classifier import PROFILES_KEY, all_vectors, fill, vector_field
+
+def precompute(concurrency=4, force=False):
+    """Classify every quiz answer vector that is not in the table yet."""
+    done = set() if force else {f.decode() for f in redis_conn.hkeys(PROFILES_KEY)}
+    todo = [v for v in all_vectors() if vector_field(v) not in done]
+    print(f"🧮 {len(done)} profiles stored; classifying {len(todo)} answer vectors...")
+
+    pool = Pool(concurrency)
+    count = 0
+    for profile in pool.imap_unordered(fill, todo):
+        if profile:
+            count += 1
+            if count % 100 == 0:
+                print(f"  ...{count} classified")
+
+    print(f"✅ Stored {count} of {len(todo)} profiles in {PROFILES_KEY}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the investor-profile table for every quiz answer vector.")
+    parser.add_argument("--concurrency", type=int, default=4, help="model calls in flight at once")
+    parser.add_argument("--force", action="store_true", help="reclassify vectors that are already stored")
+    args = parser.parse_args()
+    # Service modules log instead of printing; show them on the console too
+    configure_logging()
+    precompute(concurrency=args.concurrency, force=args.force)
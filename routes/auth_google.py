@@ -3,13 +3,14 @@ from flask import Blueprint, redirect, url_for, session
 from authlib.integrations.flask_client import OAuth
 from dotenv import load_dotenv
 import os
+import logging
 from services.auth_utils import generate_jwt_token
 from db import UserProfile
-import traceback
 
 
 load_dotenv()
 auth_bp = Blueprint("auth", __name__)
+logger = logging.getLogger(__name__)
 oauth = OAuth()
 
 def register_oauth(app):
@@ -39,13 +40,12 @@ def auth_callback():
         session["user"] = user_info
 
         jwt_token = generate_jwt_token(user_info)
-        print(jwt_token)
+        logger.info("Issued JWT for %s", user_info.get("email"))
         existing_profile = UserProfile.query.filter_by(email=user_info["email"]).first()
         if existing_profile:
             return redirect(f"https://money-mind.org/?token={jwt_token}")
         else:
             return redirect(f"https://money-mind.org/profile?token={jwt_token}")
     except Exception as e:
-        print(f"[OAuth Error] {e}")
-        traceback.print_exc()
+        logger.exception("OAuth error: %s", e)
         return "Authentication failed", 500
\ No newline at end of file
@@ -1,156 +1,91 @@
-import requests
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response, stream_with_context
 import os
-
-from redis.exceptions import ConnectionError as RedisConnectionError
+import json
+import logging
 
 from dotenv import load_dotenv, find_dotenv
-from services.summary_generator import generate_ai_summary
-from services.financials import interpret_financials
+from services.stock_aggregator import assemble_stock_data, cached_yf_info
+from services.summary_generator import stream_ai_summary
+from services.yahoo_client import map_yahoo_overview
+from services.quotes import MAX_BATCH_SYMBOLS, get_quotes, normalize_symbols
+from services.popularity import popularity
+from services.metrics import timed
 from services.ticker_utils import get_ticker_suggestions
-from services.yahoo_client import fetch_yahoo_quote_json
-import yfinance as yf
 from datetime import datetime
-from functools import lru_cache
 
 load_dotenv(find_dotenv())
-
+logger = logging.getLogger(__name__)
 
 stock_bp = Blueprint('stock', __name__, url_prefix='/api/stock')
 
-@lru_cache(maxsize=128)
-def fetch_yf_info(symbol: str) -> dict:
+@stock_bp.route('/batch', methods=['GET', 'POST'])
+def get_batch_quotes():
     """
-    Cached lookup of ticker.info via yfinance for faster repeated calls.
+    Prev-day OHLC and change for many symbols: `?symbols=A,B,C`, or a JSON
+    body `{"symbols": [...]}` for long lists.
     """
-    return {}
+    if request.method == 'POST':
+        symbols = (request.get_json(silent=True) or {}).get("symbols") or []
+        if not isinstance(symbols, list) or not all(isinstance(s, str) for s in symbols):
+            return jsonify({"error": "symbols must be a list of strings"}), 400
+    else:
+        symbols = request.args.get("symbols", "").split(",")
+
+    symbols = normalize_symbols(symbols)
+    if len(symbols) > MAX_BATCH_SYMBOLS:
+        return jsonify({"error": f"at most {MAX_BATCH_SYMBOLS} symbols per request, got {len(symbols)}"}), 400
 
-def fetch_polygon_news(ticker):
-    api_key = os.getenv("POLYGON_API_KEY")
-    url = f"https://api.polygon.io/v2/reference/news?ticker={ticker}&limit=5&order=desc&apiKey={api_key}"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        news_data = response.json().get("results", [])
-        cleaned_news = []
-        for item in news_data:
-            cleaned_news.append({
-                "title": item.get("title", "Untitled"),
-                "summary": item.get("description", "No summary available."),
-                "url": item.get("article_url", "#"),
-                "sentiment": "Neutral"
-            })
-        return cleaned_news
+        return jsonify(get_quotes(symbols))
     except Exception as e:
-        print(f"❌ Failed to fetch news: {e}")
-        return []
+        logger.exception("Error in get_batch_quotes: %s", e)
+        return jsonify({"error": "Error fetching quotes"}), 500
 
 @stock_bp.route('/<symbol>', methods=['GET'])
+@timed("get_stock_data")
 def get_stock_data(symbol):
-    def format_large_number(num):
-        try:
-            num = float(num)
-            for unit in ['', 'K', 'M', 'B', 'T']:
-                if abs(num) < 1000.0:
-                    return f"{num:.1f} {unit}".strip()
-                num /= 1000.0
-            return f"{num:.1f} P"
-        except:
-            return "-"
-
     try:
-        POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
-
-        ohlc_url = f"https://api.polygon.io/v2/aggs/ticker/{symbol.upper()}/prev?adjusted=true&apiKey={POLYGON_API_KEY}"
-        ohlc_res = requests.get(ohlc_url)
-        ohlc_data = ohlc_res.json().get("results", [{}])[0]
-
-        open_price = ohlc_data.get("o", "-")
-        high_price = ohlc_data.get("h", "-")
-        low_price = ohlc_data.get("l", "-")
-        close_price = ohlc_data.get("c", "-")
-        volume = ohlc_data.get("v", "-")
-
-        # Fetch Yahoo Finance overview metrics
-        try:
-            yahoo_overview = fetch_yahoo_quote_json(symbol.upper())
-        except Exception as e:
-            print(f"[stock] Yahoo overview fetch failed for {symbol}: {e}")
-            yahoo_overview = {}
-        
-        try:
-            tk_info = yf.Ticker(symbol.upper()).info or {}
-        except Exception as e:
-            print(f"[stock] yfinance info fetch failed for {symbol}: {e}")
-            tk_info = {}
+        # ?summary=stream returns without waiting on the AI summary
+        defer_summary = request.args.get("summary") == "stream"
+        popularity.record(symbol, "stock")
+        response_data = assemble_stock_data(symbol, defer_summary=defer_summary)
+        return jsonify(response_data)
+    
+    except Exception as e:
+        logger.exception("Error in get_stock_data for %s: %s", symbol, e)
+        return jsonify({"error": f"Error fetching data for {symbol}"}), 500
 
-        # Determine if ETF and set sector accordingly
-        is_etf = tk_info.get('quoteType') == 'ETF'
-        sector_value = 'ETF' if is_etf else tk_info.get('sector', '-')
+@stock_bp.route('/popular')
+def get_popular():
+    """
+    Most-viewed symbols right now, as `[{"symbol", "score"}]`.
+    """
+    limit = min(request.args.get("limit", 20, type=int), 100)
+    return jsonify([{"symbol": s, "score": round(score, 2)} for s, score in popularity.top(limit)])
 
-        # Generate AI summary, but handle Redis connection issues gracefully
-        try:
-            summary = generate_ai_summary(yahoo_overview, symbol)
-        except RedisConnectionError as e:
-            print(f"[stock] Redis connection unavailable for summary: {e}")
-            summary = ""
-        except Exception as e:
-            print(f"[stock] summary generation error: {e}")
-            summary = ""
+@stock_bp.route('/<symbol>/summary/stream')
+def stream_summary(symbol):
+    """
+    Server-sent events: one `bullet` event per summary line as the model
+    produces it, then a `done` event.
+    """
+    symbol = symbol.upper()
 
-        # Interpret financials, handle Redis issues
+    def events():
         try:
-            fin_summary = interpret_financials(yahoo_overview)
-        except RedisConnectionError as e:
-            print(f"[stock] Redis connection unavailable for financial interpretation: {e}")
-            fin_summary = []
+            tk_info = cached_yf_info(symbol)
+            yahoo_overview = map_yahoo_overview(tk_info) if tk_info else {}
+            for bullet in stream_ai_summary(yahoo_overview, symbol):
+                yield f"event: bullet\ndata: {json.dumps(bullet)}\n\n"
         except Exception as e:
-            print(f"[stock] financial interpretation error: {e}")
-            fin_summary = []
-
-        category_tags = []
-        if 'pays_dividends' in fin_summary:
-            category_tags.append("Dividend Lovers")
-        if 'high_pe' in fin_summary or 'high_beta' in fin_summary:
-            category_tags.append("High Growth")
-        if 'low_beta' in fin_summary or 'low_pe' in fin_summary:
-            category_tags.append("Safe Picks")
-
-        news = fetch_polygon_news(symbol)
-
-        response_data = {
-            "symbol": symbol.upper(),
-            "name": tk_info.get("longName", symbol.upper()),
-            "sector": sector_value,
-            "market_cap": tk_info.get("marketCap", "-"),
-            "pe_ratio": tk_info.get("trailingPE", "-"),
-            "ai_summary": summary,
-            "categoryTags": category_tags,
-            "news": news,
-            "open": open_price,
-            "high": high_price,
-            "low": low_price,
-            "close": close_price,
-            "volume": format_large_number(volume),
-            "change": (
-                round(close_price - open_price, 2)
-                if isinstance(open_price, (int, float)) and isinstance(close_price, (int, float))
-                else "-"
-            ),
-            "percent_change": (
-                f"{round(((close_price - open_price) / open_price) * 100, 2)}%"
-                if isinstance(open_price, (int, float)) and open_price != 0 and isinstance(close_price, (int, float))
-                else "-"
-            ),
-            # Merge Yahoo overview fields into the response
-            **yahoo_overview,
-        }
+            logger.exception("Error in stream_summary for %s: %s", symbol, e)
+        yield "event: done\ndata: {}\n\n"
 
-        return jsonify(response_data)
-    
-    except Exception as e:
-        print(f"Error in get_stock_data: {e}")
-        return jsonify({"error": f"Error fetching data for {symbol}"}), 500
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @stock_bp.route('/suggest')
 def suggest_tickers():
@@ -160,9 +95,12 @@ def suggest_tickers():
 
     try:
         results = get_ticker_suggestions(query)
+        # Count only exact symbol matches; partial queries say little about interest
+        if results and results[0]["symbol"] == query.strip().upper():
+            popularity.record(results[0]["symbol"], "suggest")
         return jsonify(results)
     except Exception as e:
-        print(f"[ERROR] Suggestion error: {e}")
+        logger.exception("Suggestion error: %s", e)
         return jsonify([]), 500
 
 @stock_bp.route('/<symbol>/history')
@@ -170,6 +108,7 @@ def get_historical_data(symbol):
     try:
         POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
         granularity = request.args.get("granularity", "1min")
+        popularity.record(symbol, "history")
 
         from services.historical import fetch_polygon_history
 
@@ -179,9 +118,17 @@ def get_historical_data(symbol):
         from_dt = datetime.fromisoformat(from_time) if from_time else None
         to_dt = datetime.fromisoformat(to_time) if to_time else None
 
-        results = fetch_polygon_history(symbol, granularity, from_dt, to_dt)
+        # Optional server-side downsampling for long ranges
+        max_points = request.args.get("max_points", type=int)
+        method = request.args.get("downsample", "ohlc")
+        if max_points is not None and max_points < 3:
+            return jsonify({"error": "max_points must be at least 3"}), 400
+        if method not in ("ohlc", "lttb"):
+            return jsonify({"error": "downsample must be 'ohlc' or 'lttb'"}), 400
+
+        results = fetch_polygon_history(symbol, granularity, from_dt, to_dt, max_points, method)
 
         return jsonify(results)
     except Exception as e:
-        print(f"Error in get_historical_data: {e}")
+        logger.exception("Error in get_historical_data for %s: %s", symbol, e)
         return jsonify({"error": f"Error fetching historical data for {symbol}"}), 500
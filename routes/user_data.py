@@ -1,8 +1,12 @@
+import logging
 from flask import Blueprint, request, jsonify
 from db import db, UserProfile
 from services.auth_utils import get_jwt_email
+from services.quotes import get_quotes
+from services.metrics import observe
 
 user_data_bp = Blueprint("user_data", __name__)
+logger = logging.getLogger(__name__)
 
 @user_data_bp.route("/api/user-data", methods=["GET"])
 def get_user_data():
@@ -10,14 +14,31 @@ def get_user_data():
     if not email:
         return jsonify({"error": "Unauthorized"}), 401
 
-    profile = UserProfile.query.filter_by(email=email).first()
+    hydrate = request.args.get("hydrate") == "quotes"
+
+    with observe("postgres", "user_profile.get"):
+        profile = UserProfile.query.filter_by(email=email).first()
     if not profile:
-        return jsonify({"profile": None, "watchlist": []})
-    
-    return jsonify({
+        empty = {"profile": None, "watchlist": []}
+        if hydrate:
+            empty["quotes"] = {}
+        return jsonify(empty)
+
+    watchlist = profile.watchlist_symbols or []
+    response = {
         "profile": profile.investor_profile,
-        "watchlist": profile.watchlist_symbols or []
-    })
+        "watchlist": watchlist
+    }
+    if hydrate:
+        # ?hydrate=quotes: prev-day quotes inline, from one MGET of the quote cache
+        try:
+            quotes = get_quotes(watchlist)
+            response["quotes"] = {q["symbol"]: q for q in quotes["quotes"]}
+            response["quotes_date"] = quotes["date"]
+        except Exception as e:
+            logger.warning("Quote hydration failed: %s", e)
+            response["quotes"] = {}
+    return jsonify(response)
 
 @user_data_bp.route("/api/user-data", methods=["POST"])
 def update_user_data():
@@ -31,7 +52,8 @@ def update_user_data():
     investor_profile = data.get("profile")
     incoming_watchlist = data.get("watchlist") or []
 
-    existing_profile = UserProfile.query.filter_by(email=email).first()
+    with observe("postgres", "user_profile.get"):
+        existing_profile = UserProfile.query.filter_by(email=email).first()
     existing_watchlist = existing_profile.watchlist_symbols if existing_profile else []
 
     merged_watchlist = list(set((existing_watchlist or []) + incoming_watchlist))
@@ -43,13 +65,14 @@ def update_user_data():
             watchlist_symbols=merged_watchlist,
             theme=theme or existing_profile.theme if existing_profile else None
         )
-        db.session.merge(merged_profile)
+        with observe("postgres", "user_profile.save"):
+            db.session.merge(merged_profile)
 
-        db.session.flush()
+            db.session.flush()
 
-        db.session.commit()
+            db.session.commit()
     except Exception as e:
-        print("[user_data] DB error during save:", e)
+        logger.exception("DB error during save: %s", e)
         db.session.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -2,31 +2,43 @@ import os
 from gevent import monkey
 monkey.patch_all()
 
-from flask import Flask, request
+import logging
+from flask import Flask, Response, request
 from flask_cors import CORS
 from dotenv import load_dotenv, find_dotenv
 import threading
-from redis import Redis
-import requests
-from rq import Queue
+from services.log_config import SampledLog, configure_logging
+
+configure_logging()
+
 from routes.stock import stock_bp
 from routes.user_data import user_data_bp
 from routes.investor_profile import profile_bp
-import json
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 from services.polygon_proxy import (
     run_polygon_proxy,
+    stop_polygon_proxy,
     subscribe_callback,
-    subscribe_symbol,
-    unsubscribe_symbol,
+    subscriptions,
 )
+from services.subscription_index import SubscriptionIndex, symbol_room
+from services.subscription_manager import SubscriptionManager
+from services.stream_bus import STREAM_MODE, StreamBus
+from services.stream_codec import COMPACT_EVENT, encode_compact, encode_full
+from services.cache_warmer import cache_warmer
+from services.news_store import news_store
+from services.popularity import popularity
+from services.metrics import SOCKETIO_EMITS, SOCKETIO_RECIPIENTS, render as render_metrics
+from services.ticker_index import ticker_index
 from routes.auth_google import auth_bp, register_oauth
 from db import db
 from flask_migrate import Migrate
 
-API_BASE = os.getenv("VITE_API_URL", "http://127.0.0.1:3000")
 
 load_dotenv(find_dotenv())
+logger = logging.getLogger("server")
+log_forward = SampledLog(logger)
+
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
@@ -48,6 +60,11 @@ def ping():
     except Exception as e:
         return f"❌ DB error: {e}", 500
 
+@app.route("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 # Enable CORS for React dev server with credentials support
 CORS(
     app,
@@ -59,45 +76,35 @@ CORS(
 socketio = SocketIO(
     app,
     cors_allowed_origins=["https://money-mind.org", "http://localhost:5173"],
-    async_mode="gevent"
+    async_mode="gevent",
+    # "msgpack" sends binary frames; clients then need socket.io-msgpack-parser
+    serializer=os.getenv("SOCKETIO_SERIALIZER", "default"),
+    # Needed when running several workers so server-side emits reach every process
+    message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE") or (
+        os.getenv("REDIS_URL", "redis://") if STREAM_MODE == "shared" else None
+    ),
 )
 
-with open("client/src/StarterPacks.ts", "r") as f:
-    content = f.read()
-    # This assumes STARTER_TICKERS is exported as an array in TS file
-    start = content.index('[')
-    end = content.index(']') + 1
-    tickers_list = json.loads(content[start:end])
-
-prefetch_list = tickers_list
-
-# Prefetch logic using RQ
-try:
-    redis_conn = Redis()
-    q = Queue(connection=redis_conn)
-except Exception as e:
-    print(f"⚠️ Redis not available: {e}")
-    q = None
-
-def fetch_and_cache_symbol(symbol: str):
-    url = f"{API_BASE}/api/stock/{symbol}"
-    try:
-        print("Worker fetching", symbol, "→", url)
-        requests.get(url, timeout=10)
-    except Exception as e:
-        print("Worker failed:", e)
-
-def delayed_prefetch():
-    import time
-    time.sleep(1.5)
-    if not q:
-        print("⚠️ Prefetch skipped: Redis not available")
-        return
-    for ticker in prefetch_list:
-        print(f"🟢 Enqueuing: {ticker}")
-        q.enqueue(fetch_and_cache_symbol, ticker)
-
-client_subscriptions = {}  # sid -> set of symbols
+# In "local" mode this process owns the Polygon websocket and its clients hold
+# upstream refs directly. In "shared" mode one elected process owns it, and
+# this worker's client demand is published to it through Redis.
+if STREAM_MODE == "shared":
+    stream_bus = StreamBus()
+    client_manager = SubscriptionManager(
+        stream_bus.demand,
+        tick=float(os.getenv("POLYGON_SUB_TICK_SECONDS", "0.25")),
+        grace=0,  # the leader applies the unsubscribe grace period
+    )
+else:
+    stream_bus = None
+    client_manager = subscriptions
+
+# sid <-> symbol index of this process's clients;
+# fan-out itself goes through one Socket.IO room per symbol
+client_subscriptions = client_manager.index
+# Subset of the above whose clients asked for compact frames
+compact_subscriptions = SubscriptionIndex()
+compact_clients = set()
 
 
 # JWT authentication for Socket.IO connections
@@ -105,47 +112,90 @@ client_subscriptions = {}  # sid -> set of symbols
 def handle_connect(auth):
     token = auth.get("token") if auth else None
     if not token:
-        print(f"❌ Unauthorized socket connection from {request.sid}")
+        logger.warning("Unauthorized socket connection from %s", request.sid)
         return False  # disconnect
-    print(f"✅ Authorized socket connection: {request.sid}")
+    if auth.get("format") == "compact":
+        compact_clients.add(request.sid)
+    logger.info("Authorized socket connection: %s", request.sid)
 
 @socketio.on("subscribe")
 def handle_subscribe(data):
     symbol = data.upper()
     sid = request.sid
-    client_subscriptions.setdefault(sid, set()).add(symbol)
-    print(f"[Socket.IO] {sid} subscribed to {symbol}")
+    if sid in compact_clients:
+        compact_subscriptions.add(sid, symbol)
+        join_room(symbol_room(symbol, compact=True))
+    else:
+        join_room(symbol_room(symbol))
+    logger.debug("%s subscribed to %s", sid, symbol)
     # Ensure the proxy streams this symbol
-    subscribe_symbol(symbol)
+    client_manager.acquire(sid, symbol)
+    popularity.record(symbol, "subscribe")
 
 @socketio.on("unsubscribe")
 def handle_unsubscribe(data):
     symbol = data.upper()
     sid = request.sid
-    if sid in client_subscriptions:
-        client_subscriptions[sid].discard(symbol)
-        print(f"[Socket.IO] {sid} unsubscribed from {symbol}")
-    # Stop proxy stream if nobody else is subscribed
-    unsubscribe_symbol(symbol)
+    if sid in compact_clients:
+        compact_subscriptions.remove(sid, symbol)
+        leave_room(symbol_room(symbol, compact=True))
+    else:
+        leave_room(symbol_room(symbol))
+    logger.debug("%s unsubscribed from %s", sid, symbol)
+    # Proxy drops the stream once nobody else is subscribed (after a grace period)
+    client_manager.release(sid, symbol)
 
 @socketio.on("disconnect")
 def handle_disconnect():
     sid = request.sid
-    client_subscriptions.pop(sid, None)
-    print(f"[Socket.IO] Client disconnected: {sid}")
+    # Socket.IO drops the sid from its rooms on its own; release its upstream refs
+    client_manager.release_all(sid)
+    compact_subscriptions.remove_sid(sid)
+    compact_clients.discard(sid)
+    logger.info("Client disconnected: %s", sid)
 
 def forward_polygon_update(msg):
     if not hasattr(msg, "symbol"):
         return
     symbol = msg.symbol
-    for sid, symbols in client_subscriptions.items():
-        if symbol in symbols:
-            socketio.emit("update", msg.__dict__, room=sid)
-            print(f"[Forward] Emitted update for {symbol} to {sid}")
-
-subscribe_callback(forward_polygon_update)
+    total = len(client_subscriptions.subscribers(symbol))
+    if not total:
+        return
+    compact = len(compact_subscriptions.subscribers(symbol))
+    # One emit per message and format; the room fans it out to every subscribed sid.
+    # Fan-out stays local: every worker receives the aggregate and serves its own clients.
+    if total > compact:
+        socketio.emit("update", encode_full(msg), to=symbol_room(symbol), ignore_queue=True)
+        SOCKETIO_EMITS.labels("full").inc()
+    if compact:
+        socketio.emit(COMPACT_EVENT, encode_compact(msg), to=symbol_room(symbol, compact=True), ignore_queue=True)
+        SOCKETIO_EMITS.labels("compact").inc()
+    SOCKETIO_RECIPIENTS.inc(total)
+    log_forward("Emitted update for %s to %d clients", symbol, total)
+
+def start_streaming():
+    """
+    Start the live-update pipeline for this process. Under gunicorn this runs
+    from the post_worker_init hook in gunicorn.conf.py (via start_background_jobs).
+    """
+    if stream_bus is not None:
+        subscribe_callback(stream_bus.publish_aggregate)
+        stream_bus.start(run_polygon_proxy, subscriptions, forward_polygon_update, stop_upstream=stop_polygon_proxy)
+    else:
+        subscribe_callback(forward_polygon_update)
+        threading.Thread(target=run_polygon_proxy, daemon=True).start()
+
+def start_background_jobs():
+    """
+    Start this process's background work: live updates, popularity
+    tracking and the cache warmer.
+    """
+    start_streaming()
+    for listener in (ticker_index.set_popularity, news_store.set_popularity, cache_warmer.set_popularity):
+        popularity.add_listener(listener)
+    popularity.start()
+    cache_warmer.start()
 
 if __name__ == '__main__':
-    threading.Thread(target=delayed_prefetch).start()
-    threading.Thread(target=run_polygon_proxy, daemon=True).start()
+    start_background_jobs()
     socketio.run(app, host='localhost', port=3000)
\ No newline at end of file
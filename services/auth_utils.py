@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime, timedelta
 import os
 import jwt
@@ -6,6 +7,8 @@ from flask import request
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 
@@ -18,17 +21,17 @@ def get_jwt_email():
         return None
     token = parts[1]
     if not token:
-        print("[user_data] Warning: JWT token is empty or malformed")
+        logger.warning("JWT token is empty or malformed")
         return None
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         return payload.get("email")
     except jwt.ExpiredSignatureError:
-        print("[user_data] JWT has expired")
+        logger.debug("JWT has expired")
         from flask import jsonify
         return jsonify({"error": "token_expired"}), 401
     except jwt.InvalidTokenError as e:
-        print(f"[user_data] JWT decode error: {e}")
+        logger.warning("JWT decode error: %s", e)
         return None
     
 def generate_jwt_token(user_info):
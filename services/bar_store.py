@@ -0,0 +1,161 @@
+"""
+Persistent per-symbol, per-granularity OHLC bar store in Redis.
+
+Each (symbol, granularity) pair is a sorted set scored by bar start time in
+epoch milliseconds, plus a small hash recording which windows have already
+been fetched from Polygon (a sorted list of disjoint spans). `missing_ranges`
+tells the caller which slices still need an upstream call, so a chart reload becomes a local range read.
+Redis sorted sets are used instead of streams because streams cannot take
+entries older than their last ID, and older head gaps need backfilling.
+"""
+import json
+import os
+import time
+
+from cache.redis_client import redis_conn
+
+BAR_MS = {
+    "1min": 60_000,
+    "5min": 300_000,
+    "30min": 1_800_000,
+    "1h": 3_600_000,
+    "1d": 86_400_000,
+}
+
+# Don't ask Polygon for the open tail more often than this, per series.
+MAX_TAIL_REFRESH_MS = 5 * 60_000
+
+# Series nobody has read for this long are dropped.
+RETENTION_SECONDS = 30 * 24 * 3600
+
+# Polygon's delayed plan publishes bars this long after they close, so the
+# most recent window is never recorded as covered. 0 on a real-time plan.
+FEED_DELAY_MS = int(float(os.getenv("POLYGON_FEED_DELAY_SECONDS", "900")) * 1000)
+
+
+def merge_spans(spans):
+    """
+    Sort `[first, last]` spans and merge the ones that overlap or touch.
+    Disjoint spans stay apart, so a gap between them is never marked covered.
+    """
+    merged = []
+    for first, last in sorted(spans):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged
+
+
+class BarStore:
+    def __init__(self, redis_client=redis_conn, retention_seconds=RETENTION_SECONDS, feed_delay_ms=FEED_DELAY_MS):
+        self.redis = redis_client
+        self.retention_seconds = retention_seconds
+        self.feed_delay_ms = feed_delay_ms
+
+    def _keys(self, symbol, granularity):
+        base = f"bars:{symbol.upper()}:{granularity}"
+        return base, f"{base}:meta"
+
+    def coverage(self, symbol, granularity):
+        """
+        Return `(spans, checked_ms)` for the stored data, or None. `spans` is
+        the sorted list of disjoint `[first_ms, last_ms]` windows fetched so far.
+        """
+        _, meta_key = self._keys(symbol, granularity)
+        meta = self.redis.hgetall(meta_key)
+        if not meta:
+            return None
+        if b"spans" in meta:
+            spans = json.loads(meta[b"spans"])
+        else:
+            # Series written before spans were tracked hold one window
+            spans = [[int(meta[b"first"]), int(meta[b"last"])]]
+        return spans, int(meta[b"checked"])
+
+    def missing_ranges(self, symbol, granularity, start_ms, end_ms, now_ms=None):
+        """
+        List the `(start_ms, end_ms)` slices of the requested window that must
+        still be fetched from upstream: every gap between stored spans, plus
+        the open tail once it is due for a refresh.
+        """
+        now_ms = now_ms or int(time.time() * 1000)
+        end_ms = min(end_ms, now_ms)
+        if end_ms < start_ms:
+            return []
+
+        cov = self.coverage(symbol, granularity)
+        if cov is None:
+            return [(start_ms, end_ms)]
+
+        spans, checked = cov
+        missing = []
+        cursor = start_ms
+        for first, last in spans:
+            if last < cursor:
+                continue
+            if first > end_ms:
+                break
+            if first > cursor:
+                missing.append((cursor, first - 1))
+            cursor = last + 1
+        if cursor <= end_ms:
+            last = cursor - 1
+            if cursor > start_ms and last == spans[-1][1]:
+                # Tail past everything stored: throttle refreshes, and start one
+                # bar back since the last stored bar may have been partial.
+                # Bars inside the feed delay are never covered, so only what
+                # has been published since counts as new.
+                bar_ms = BAR_MS.get(granularity, 60_000)
+                refresh_ms = min(bar_ms, MAX_TAIL_REFRESH_MS)
+                published_ms = min(end_ms, now_ms - self.feed_delay_ms)
+                if now_ms - checked >= refresh_ms or published_ms - last > bar_ms:
+                    missing.append((max(start_ms, last - bar_ms), end_ms))
+            else:
+                missing.append((cursor, end_ms))
+        return missing
+
+    def write(self, symbol, granularity, bars, start_ms, end_ms, now_ms=None):
+        """
+        Replace the stored bars in `[start_ms, end_ms]` with `bars`, a list of
+        `(t, o, h, l, c, v)` tuples, and add the window to the covered spans.
+        Coverage stops `feed_delay_ms` before now, since bars in that stretch
+        may not have been published yet; the tail refresh fetches them later.
+        """
+        now_ms = now_ms or int(time.time() * 1000)
+        end_ms = min(end_ms, now_ms)
+        covered_end = min(end_ms, now_ms - self.feed_delay_ms)
+        key, meta_key = self._keys(symbol, granularity)
+        cov = self.coverage(symbol, granularity)
+        spans = cov[0] if cov else []
+        if covered_end >= start_ms:
+            spans = merge_spans(spans + [[start_ms, covered_end]])
+
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(key, start_ms, end_ms)
+        if bars:
+            pipe.zadd(key, {":".join(str(x) for x in bar): bar[0] for bar in bars})
+        pipe.hdel(meta_key, "first", "last")
+        pipe.hset(meta_key, mapping={"spans": json.dumps(spans), "checked": now_ms})
+        pipe.expire(key, self.retention_seconds)
+        pipe.expire(meta_key, self.retention_seconds)
+        pipe.execute()
+
+    def read(self, symbol, granularity, start_ms, end_ms):
+        """
+        Return the stored `(t, o, h, l, c, v)` bars in `[start_ms, end_ms]`, oldest first.
+        """
+        key, meta_key = self._keys(symbol, granularity)
+        pipe = self.redis.pipeline()
+        pipe.zrangebyscore(key, start_ms, end_ms)
+        pipe.expire(key, self.retention_seconds)
+        pipe.expire(meta_key, self.retention_seconds)
+        members = pipe.execute()[0]
+        bars = []
+        for member in members:
+            t, o, h, l, c, v = member.decode().split(":")
+            bars.append((int(t), float(o), float(h), float(l), float(c), float(v)))
+        return bars
+
+
+bar_store = BarStore()
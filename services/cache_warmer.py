@@ -0,0 +1,159 @@
+"""
+Keeps the stock-page caches warm for the symbols most likely to be viewed.
+
+On a schedule, the warmer runs `assemble_stock_data` in-process for a ranked
+list of symbols, so the prev-day bar, fundamentals and AI summary land in
+their caches without going through the web tier. Symbols are ranked by
+popularity (`set_popularity`), with the STARTER pack tickers after them, and
+the list is capped at `WARM_MAX_SYMBOLS`.
+
+Only one worker warms per interval (Redis lock). Each run logs how many
+fragments were already fresh before it started, which is the hit rate a
+visitor would have seen, and keeps it in `last_report`.
+"""
+import json
+import logging
+import os
+import re
+import time
+
+import gevent
+from gevent.pool import Pool
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+from services.stock_aggregator import assemble_stock_data, stock_cache, cached_yf_info
+from services.summary_generator import summary_cache
+from services.yahoo_client import map_yahoo_overview
+
+logger = logging.getLogger(__name__)
+
+STARTER_PACKS_FILE = "client/src/StarterPacks.ts"
+
+WARM_INTERVAL_SECONDS = int(os.getenv("WARM_INTERVAL_SECONDS", "900"))
+WARM_CONCURRENCY = int(os.getenv("WARM_CONCURRENCY", "4"))
+WARM_MAX_SYMBOLS = int(os.getenv("WARM_MAX_SYMBOLS", "100"))
+WARM_START_DELAY = 1.5
+
+LOCK_KEY = "warmer:lock"
+REPORT_KEY = "warmer:last_report"
+
+FRAGMENTS = ("ohlc", "fundamentals", "summary")
+
+_PACK_RE = re.compile(r"\[([^\[\]]*)\]")
+_SYMBOL_RE = re.compile(r"['\"]([A-Za-z.\-]+)['\"]")
+
+
+def load_starter_tickers(path=STARTER_PACKS_FILE):
+    """
+    Every ticker in the STARTER_PACKS arrays, in file order, without duplicates.
+    """
+    try:
+        with open(path, "r") as f:
+            content = f.read()
+    except OSError as e:
+        logger.warning("Could not read starter packs: %s", e)
+        return []
+    tickers = []
+    for pack in _PACK_RE.findall(content):
+        for sym in _SYMBOL_RE.findall(pack):
+            if sym.upper() not in tickers:
+                tickers.append(sym.upper())
+    return tickers
+
+
+class CacheWarmer:
+    def __init__(self, starter_symbols=None, concurrency=WARM_CONCURRENCY,
+                 interval=WARM_INTERVAL_SECONDS, redis_client=redis_conn):
+        self.starter_symbols = starter_symbols if starter_symbols is not None else load_starter_tickers()
+        self.concurrency = concurrency
+        self.interval = interval
+        self.redis = redis_client
+        self.popularity = {}
+        self.last_report = None
+        self._runner = None
+
+    def set_popularity(self, scores):
+        self.popularity = scores
+
+    def priority_list(self):
+        """
+        Popular symbols by score, then the remaining starter tickers.
+        """
+        ranked = sorted(self.popularity, key=lambda s: -self.popularity[s])
+        ranked += [s for s in self.starter_symbols if s not in self.popularity]
+        return ranked[:WARM_MAX_SYMBOLS]
+
+    def _fresh_fragments(self, symbol):
+        fresh = {
+            "ohlc": stock_cache.peek("ohlc", symbol) == "fresh",
+            "fundamentals": stock_cache.peek("fundamentals", symbol) == "fresh",
+            "summary": False,
+        }
+        if fresh["fundamentals"]:
+            info = cached_yf_info(symbol)
+            overview = map_yahoo_overview(info) if info else {}
+            fresh["summary"] = summary_cache.peek(symbol, overview) is not None
+        return fresh
+
+    def warm_symbol(self, symbol):
+        """
+        Fill the caches for `symbol`. Returns which fragments were fresh before.
+        """
+        try:
+            fresh = self._fresh_fragments(symbol)
+            if not all(fresh.values()):
+                assemble_stock_data(symbol)
+            return fresh
+        except Exception as e:
+            logger.exception("Failed to warm %s: %s", symbol, e)
+            return None
+
+    def run_once(self):
+        symbols = self.priority_list()
+        start = time.time()
+        pool = Pool(self.concurrency)
+        hits = dict.fromkeys(FRAGMENTS, 0)
+        warmed = failed = 0
+        for fresh in pool.imap(self.warm_symbol, symbols):
+            if fresh is None:
+                failed += 1
+                continue
+            warmed += 1
+            for fragment, was_fresh in fresh.items():
+                hits[fragment] += was_fresh
+
+        report = {
+            "finished_at": time.time(),
+            "duration": round(time.time() - start, 2),
+            "symbols": len(symbols),
+            "failed": failed,
+            "hit_rate": {f: round(hits[f] / warmed, 3) if warmed else 0.0 for f in FRAGMENTS},
+        }
+        self.last_report = report
+        try:
+            self.redis.set(REPORT_KEY, json.dumps(report))
+        except RedisError:
+            pass
+        rates = ", ".join(f"{f} {report['hit_rate'][f]:.0%}" for f in FRAGMENTS)
+        logger.info("Warmed %d symbols in %ss (%d failed); already fresh: %s",
+                    len(symbols), report["duration"], failed, rates)
+        return report
+
+    def _run_forever(self):
+        gevent.sleep(WARM_START_DELAY)
+        while True:
+            try:
+                # One warmer per interval across all workers
+                if self.redis.set(LOCK_KEY, "1", nx=True, ex=max(self.interval - 5, 1)):
+                    self.run_once()
+            except RedisError as e:
+                logger.warning("Redis unavailable, skipping run: %s", e)
+            gevent.sleep(self.interval)
+
+    def start(self):
+        if self._runner is None:
+            self._runner = gevent.spawn(self._run_forever)
+
+
+cache_warmer = CacheWarmer()
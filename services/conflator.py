@@ -0,0 +1,50 @@
+"""
+Conflation of streamed aggregate updates.
+
+Polygon can deliver several revisions of the same minute bar in a burst;
+clients only need the newest one. `Conflator` keeps the latest message per
+(symbol, bar start) and hands the batch on every `interval` seconds.
+Distinct bars of one symbol are kept apart, so no candle is lost.
+An interval of 0 disables conflation and delivers each message right away.
+
+`observe_lag`, if given, is called with the seconds between a message's
+arrival (the first revision of its bar in the batch) and the end of its
+delivery.
+"""
+import time
+
+import gevent
+
+
+class Conflator:
+    def __init__(self, deliver, interval=0.25, observe_lag=None):
+        self.deliver = deliver
+        self.interval = interval
+        self.observe_lag = observe_lag
+        self._latest = {}
+        self._arrived = {}
+        self._flusher = None
+
+    def _deliver(self, msg, arrived):
+        self.deliver(msg)
+        if self.observe_lag is not None:
+            self.observe_lag(time.monotonic() - arrived)
+
+    def offer(self, msg):
+        symbol = getattr(msg, "symbol", None)
+        if symbol is None or self.interval <= 0:
+            self._deliver(msg, time.monotonic())
+            return
+        key = (symbol, getattr(msg, "start_timestamp", None))
+        # Overwriting keeps the key in place, so bars still flush in arrival order.
+        self._latest[key] = msg
+        self._arrived.setdefault(key, time.monotonic())
+        if self._flusher is None:
+            self._flusher = gevent.spawn_later(self.interval, self.flush)
+
+    def flush(self):
+        batch, self._latest = self._latest, {}
+        arrived, self._arrived = self._arrived, {}
+        self._flusher = None
+        for key, msg in batch.items():
+            self._deliver(msg, arrived[key])
@@ -0,0 +1,82 @@
+"""
+Shape-preserving downsampling for OHLC history.
+
+`ohlc_buckets` merges runs of consecutive bars into one candle per bucket
+(first open, max high, min low, last close), which keeps every extreme a
+candlestick chart needs to draw. `lttb_indices` implements
+Largest-Triangle-Three-Buckets on the close series and keeps a subset of the
+original bars, which suits line charts.
+"""
+import numpy as np
+
+
+def _bucket_starts(n, max_points):
+    return np.unique(np.linspace(0, n, max_points + 1).astype(np.int64)[:-1])
+
+
+def ohlc_buckets(t, o, h, l, c, v, max_points):
+    """
+    Aggregate the bar arrays into at most `max_points` candles.
+    """
+    n = len(t)
+    if n <= max_points:
+        return t, o, h, l, c, v
+    starts = _bucket_starts(n, max_points)
+    ends = np.append(starts[1:], n) - 1
+    return (
+        t[starts],
+        o[starts],
+        np.maximum.reduceat(h, starts),
+        np.minimum.reduceat(l, starts),
+        c[ends],
+        np.add.reduceat(v, starts),
+    )
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Indices of the points LTTB keeps when reducing `(x, y)` to `max_points`.
+    Each bucket's candidate areas are computed in one vectorized step.
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # The first and last points are always kept; the rest are split into
+    # max_points - 2 buckets.
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    csum_x = np.concatenate(([0.0], np.cumsum(x)))
+    csum_y = np.concatenate(([0.0], np.cumsum(y)))
+
+    out = np.empty(max_points, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = (csum_x[nhi] - csum_x[nlo]) / (nhi - nlo)
+        avg_y = (csum_y[nhi] - csum_y[nlo]) / (nhi - nlo)
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample_bars(bars, max_points, method="ohlc"):
+    """
+    Reduce `(t, o, h, l, c, v)` tuples to at most `max_points` bars.
+
+    Returns a tuple of NumPy arrays `(t, o, h, l, c, v)`.
+    """
+    arr = np.asarray(bars, dtype=np.float64).reshape(-1, 6)
+    t = arr[:, 0].astype(np.int64)
+    o, h, l, c, v = (np.ascontiguousarray(arr[:, i]) for i in range(1, 6))
+    if method == "lttb":
+        keep = lttb_indices(t, c, max_points)
+        return t[keep], o[keep], h[keep], l[keep], c[keep], v[keep]
+    return ohlc_buckets(t, o, h, l, c, v, max_points)
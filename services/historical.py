@@ -1,8 +1,71 @@
-import os
+import logging
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from redis.exceptions import RedisError
+from cache.single_flight import SingleFlight
+from services.bar_store import BAR_MS, bar_store
+from services.downsample import downsample_bars
+from services.polygon_client import polygon
+from services.metrics import timed
+import numpy as np
 
-def fetch_polygon_history(symbol, granularity, from_time=None, to_time=None):
+logger = logging.getLogger(__name__)
+
+multiplier_map = {
+    "1min": (1, "minute"),
+    "5min": (5, "minute"),
+    "30min": (30, "minute"),
+    "1h": (1, "hour"),
+    "1d": (1, "day")
+}
+
+def _day_start_ms(day):
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+def fetch_polygon_aggs(symbol, granularity, start_ms, end_ms):
+    """
+    Download bars in `[start_ms, end_ms]`, following Polygon's `next_url`
+    pages. Returns `(t, o, h, l, c, v)` tuples, or None if a page failed.
+    """
+    multiplier, timespan = multiplier_map[granularity]
+    path = f"/v2/aggs/ticker/{symbol.upper()}/range/{multiplier}/{timespan}/{start_ms}/{end_ms}"
+    params = {"adjusted": "true", "sort": "asc", "limit": 50000}
+
+    try:
+        return [
+            (item["t"], item["o"], item["h"], item["l"], item["c"], item.get("v", 0))
+            for item in polygon.results(path, params, endpoint="aggs.range")
+        ]
+    except requests.RequestException as e:
+        logger.warning("Polygon history failed: %s", e)
+        return None
+
+# Coalesces the upstream fetch of each missing slice; reads of stored bars never take the lock.
+gap_flight = SingleFlight("history", lock_ttl=120)
+
+def _fill_gap(symbol, granularity, gap_start, gap_end):
+    bars = fetch_polygon_aggs(symbol, granularity, gap_start, gap_end)
+    if bars is None:
+        return False
+    bar_store.write(symbol, granularity, bars, gap_start, gap_end)
+    return True
+
+def _read_through_store(symbol, granularity, start_ms, end_ms):
+    for gap_start, gap_end in bar_store.missing_ranges(symbol, granularity, start_ms, end_ms):
+        # The open tail ends at "now", so callers within the same bar share one fetch.
+        key = f"{symbol.upper()}:{granularity}:{gap_start}:{gap_end // BAR_MS[granularity]}"
+        gap_flight.do(key, lambda: _fill_gap(symbol, granularity, gap_start, gap_end))
+    return bar_store.read(symbol, granularity, start_ms, end_ms)
+
+@timed("fetch_polygon_history")
+def fetch_polygon_history(symbol, granularity, from_time=None, to_time=None, max_points=None, method="ohlc"):
+    """
+    Bars for `symbol` as `{time, open, high, low, close}` dicts.
+
+    With `max_points`, long ranges are reduced on the server: `method="ohlc"`
+    merges bars into buckets (for candlesticks), `"lttb"` keeps the bars that
+    best preserve the shape of the close series.
+    """
     if to_time is None:
         to_time = datetime.utcnow()
     if from_time is None:
@@ -15,39 +78,36 @@ def fetch_polygon_history(symbol, granularity, from_time=None, to_time=None):
         }
         days = range_map.get(granularity, 2)
         from_time = to_time - timedelta(days=days)
-    POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
-    multiplier_map = {
-        "1min": (1, "minute"),
-        "5min": (5, "minute"),
-        "30min": (30, "minute"),
-        "1h": (1, "hour"),
-        "1d": (1, "day")
-    }
-
-    if granularity not in multiplier_map: 
+
+    if granularity not in multiplier_map:
         return []
 
-    multiplier, timespan = multiplier_map[granularity]
+    # Whole UTC days, matching the date-based window this endpoint always served.
+    start_ms = _day_start_ms(from_time.date())
+    end_ms = _day_start_ms(to_time.date() + timedelta(days=1)) - 1
 
-    url = (
-        f"https://api.polygon.io/v2/aggs/ticker/{symbol.upper()}/range/"
-        f"{multiplier}/{timespan}/{from_time.date()}/{to_time.date()}"
-        f"?adjusted=true&sort=asc&limit=5000&apiKey={POLYGON_API_KEY}"
-    )
+    # Answer from the local bar store; only missing head/tail slices go upstream.
+    try:
+        data = _read_through_store(symbol, granularity, start_ms, end_ms)
+    except RedisError as e:
+        logger.warning("Bar store unavailable, fetching directly: %s", e)
+        data = fetch_polygon_aggs(symbol, granularity, start_ms, end_ms) or []
 
-    res = requests.get(url)
-    if res.status_code != 200:
-        print(f"[ERROR] Polygon history failed: {res.json()}")
-        return []
+    if max_points and len(data) > max_points:
+        t, o, h, l, c, _ = downsample_bars(data, max_points, method)
+        times = np.datetime_as_string(t.astype("datetime64[ms]"), unit="s")
+        return [
+            {"time": ts, "open": op, "high": hi, "low": lo, "close": cl}
+            for ts, op, hi, lo, cl in zip(times.tolist(), o.tolist(), h.tolist(), l.tolist(), c.tolist())
+        ]
 
-    data = res.json().get("results", [])
     return [
         {
-            "time": datetime.utcfromtimestamp(item["t"] / 1000).isoformat(),
-            "open": item["o"],
-            "high": item["h"],
-            "low": item["l"],
-            "close": item["c"],
+            "time": datetime.utcfromtimestamp(t / 1000).isoformat(),
+            "open": o,
+            "high": h,
+            "low": l,
+            "close": c,
         }
-        for item in data
-    ]
\ No newline at end of file
+        for t, o, h, l, c, v in data
+    ]
@@ -0,0 +1,257 @@
+"""
+Investor-profile classification as a table lookup.
+
+The quiz has five questions answered 1–5, so there are only 3,125 distinct
+inputs. Each answer vector maps to one stored profile in a Redis hash, filled
+in bulk by `precompute_profiles.py` or on first request. A lookup is a single
+HGET. For vectors not classified yet, a deterministic score picks the type at
+once, and the model's answer is fetched in the background (one greenlet per
+vector across all workers) so the next request for that vector gets it.
+"""
+import itertools
+import json
+import logging
+import re
+import uuid
+
+import gevent
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+from services.llm_client import llm, LLMError
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the prompt, model or type list changes so the table is rebuilt.
+PROFILE_VERSION = 1
+
+PROFILES_KEY = f"investor_profiles:v{PROFILE_VERSION}"
+FILL_LOCK_KEY = PROFILES_KEY + ":lock:{vector}"
+FILL_LOCK_TTL = 120
+
+# Deletes the fill lock only if we still own it.
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+PROFILE_MODEL = "anthropic/claude-3-sonnet"
+
+INVESTOR_TYPES = [
+    "Growth Seeker",
+    "Cautious Planner",
+    "Dividend Hunter",
+    "Balanced Optimizer",
+    "Speculative Adventurer"
+]
+
+QUESTIONS = [
+    "Q1: How comfortable are you with losing money in the short term for potential long-term gains?",
+    "Q2: How important is a steady stream of income from your investments?",
+    "Q3: How much do you care about investing in emerging technologies or startups?",
+    "Q4: How would you rate your reaction to market volatility?",
+    "Q5: How long do you typically plan to hold investments?"
+]
+
+# Used when the model has not classified a vector yet
+FALLBACK_PROFILES = {
+    "Growth Seeker": {
+        "type_description": "You accept short-term swings in exchange for long-term growth and are drawn to innovative companies.",
+        "recommended_stocks": ["QQQ", "VUG", "SCHG"],
+        "stock_rationale": "Broad growth and Nasdaq-100 ETFs give exposure to fast-growing companies without single-stock risk.",
+        "tips": "Keep a long horizon and rebalance periodically so one sector does not dominate your portfolio.",
+    },
+    "Cautious Planner": {
+        "type_description": "You value stability and capital preservation over chasing high returns.",
+        "recommended_stocks": ["BND", "VTI", "USMV"],
+        "stock_rationale": "Bond, total-market and minimum-volatility ETFs smooth out market swings while still growing over time.",
+        "tips": "Keep an emergency fund outside the market and add to positions gradually.",
+    },
+    "Dividend Hunter": {
+        "type_description": "You want your investments to pay you a steady, growing income.",
+        "recommended_stocks": ["SCHD", "VYM", "DVY"],
+        "stock_rationale": "Dividend-focused ETFs hold established companies with a record of paying and raising dividends.",
+        "tips": "Consider reinvesting dividends while you do not need the income, and watch for yield traps.",
+    },
+    "Balanced Optimizer": {
+        "type_description": "You look for a sensible mix of growth and stability.",
+        "recommended_stocks": ["VTI", "SPY", "AOR"],
+        "stock_rationale": "Total-market, S&P 500 and allocation ETFs give diversified, low-cost exposure to both growth and defence.",
+        "tips": "Pick a target mix of stocks and bonds and rebalance to it once or twice a year.",
+    },
+    "Speculative Adventurer": {
+        "type_description": "You enjoy volatility and short holding periods in pursuit of outsized gains.",
+        "recommended_stocks": ["ARKK", "SOXX", "XBI"],
+        "stock_rationale": "Thematic innovation, semiconductor and biotech ETFs move sharply and reward well-timed conviction.",
+        "tips": "Size speculative positions so a large loss would not derail your long-term plans.",
+    },
+}
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def normalize_answers(answers):
+    """
+    Return the answers as a tuple of five ints in 1..5, or None if invalid.
+    Only JSON integers are accepted: no floats, strings or booleans.
+    """
+    if not isinstance(answers, (list, tuple)) or len(answers) != len(QUESTIONS):
+        return None
+    # bool is a subclass of int
+    if any(type(a) is not int for a in answers):
+        return None
+    if any(a < 1 or a > 5 for a in answers):
+        return None
+    return tuple(answers)
+
+
+def vector_field(vector):
+    return "".join(str(a) for a in vector)
+
+
+def score_profile(vector):
+    """
+    Deterministic classification used until the model's answer is stored.
+    """
+    risk, income, innovation, volatility, horizon = vector
+    appetite = risk + volatility
+    if appetite >= 8 and innovation >= 4 and horizon <= 2:
+        kind = "Speculative Adventurer"
+    elif income >= 4 and income >= innovation:
+        kind = "Dividend Hunter"
+    elif appetite + innovation >= 11:
+        kind = "Growth Seeker"
+    elif appetite <= 4:
+        kind = "Cautious Planner"
+    else:
+        kind = "Balanced Optimizer"
+    return {"type": kind, **FALLBACK_PROFILES[kind]}
+
+
+def build_prompt(vector):
+    formatted = "\n".join([f"{QUESTIONS[i]} Answer: {vector[i]}" for i in range(len(QUESTIONS))])
+    return f"""
+You are a financial AI assistant. Based on the user's quiz answers (rated 1 to 5), determine their investor profile and return a detailed JSON object.
+
+Available profile types: {', '.join(INVESTOR_TYPES)}.
+
+For the answers:
+{formatted}
+
+Respond ONLY with a JSON object formatted like this:
+
+{{
+  "type": "<Investor Type from list>",
+  "type_description": "<Brief explanation of their type>",
+  "recommended_stocks": ["<SYM1>", "<SYM2>", "<SYM3>"],
+  "stock_rationale": "<Why these ETFs are good for them>",
+  "tips": "<Optional advice or portfolio guidance>"
+}}
+
+Important: The recommended_stocks list must include only popular ETFs that are supported by Polygon.io and have viable financials available from them.
+"""
+
+
+def parse_profile(content):
+    """
+    Parse the model's reply as JSON and check its shape. Returns None if invalid.
+    """
+    match = _JSON_OBJECT_RE.search(content or "")
+    if not match:
+        return None
+    try:
+        parsed = json.loads(match.group())
+    except ValueError:
+        return None
+    if not isinstance(parsed, dict) or parsed.get("type") not in INVESTOR_TYPES:
+        return None
+    stocks = parsed.get("recommended_stocks")
+    if not isinstance(stocks, list) or not all(isinstance(s, str) for s in stocks):
+        return None
+    return {
+        "type": parsed["type"],
+        "type_description": str(parsed.get("type_description", "")),
+        "recommended_stocks": [s.upper() for s in stocks],
+        "stock_rationale": str(parsed.get("stock_rationale", "")),
+        "tips": str(parsed.get("tips", "")),
+    }
+
+
+def request_profile(vector):
+    """
+    Ask the model to classify `vector`. Returns the parsed profile or None.
+    """
+    try:
+        content = llm.chat(
+            "investor_profile",
+            PROFILE_MODEL,
+            [{"role": "user", "content": build_prompt(vector)}],
+            temperature=0.3,
+            max_tokens=500,
+        )
+    except LLMError as e:
+        logger.warning("Model call failed for %s: %s", vector_field(vector), e)
+        return None
+    profile = parse_profile(content)
+    if profile is None:
+        logger.warning("Unusable reply for %s: %r", vector_field(vector), content[:200])
+    return profile
+
+
+def lookup(vector, redis_client=redis_conn):
+    raw = redis_client.hget(PROFILES_KEY, vector_field(vector))
+    return json.loads(raw) if raw is not None else None
+
+
+def store(vector, profile, redis_client=redis_conn):
+    redis_client.hset(PROFILES_KEY, vector_field(vector), json.dumps(profile))
+
+
+def fill(vector, redis_client=redis_conn):
+    """
+    Classify `vector` with the model and store it, unless another greenlet or
+    worker is already doing so. Returns the stored profile, or None.
+    """
+    lock = FILL_LOCK_KEY.format(vector=vector_field(vector))
+    token = uuid.uuid4().hex
+    try:
+        if not redis_client.set(lock, token, nx=True, ex=FILL_LOCK_TTL):
+            return None
+    except RedisError:
+        return None
+    try:
+        profile = request_profile(vector)
+        if profile is not None:
+            store(vector, profile, redis_client)
+        return profile
+    except RedisError as e:
+        logger.warning("Could not store profile: %s", e)
+        return None
+    finally:
+        # A fill that outlived its lock must not delete the next holder's.
+        try:
+            redis_client.register_script(_RELEASE_LOCK)(keys=[lock], args=[token])
+        except RedisError:
+            pass
+
+
+def classify(vector, redis_client=redis_conn):
+    """
+    Stored profile for `vector`, or the scored fallback while the model's
+    answer is fetched in the background.
+    """
+    try:
+        profile = lookup(vector, redis_client)
+    except (RedisError, ValueError) as e:
+        logger.warning("Lookup failed, using fallback: %s", e)
+        return score_profile(vector)
+    if profile is not None:
+        return profile
+    gevent.spawn(fill, vector, redis_client)
+    return score_profile(vector)
+
+
+def all_vectors():
+    return itertools.product(range(1, 6), repeat=len(QUESTIONS))
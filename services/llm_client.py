@@ -0,0 +1,324 @@
+"""
+Shared client for OpenRouter chat completions.
+
+Every model call in the app goes through the `llm` singleton, which provides:
+
+- one keep-alive `requests.Session` (a pooled HTTPS connection per worker);
+- a global concurrency cap, plus a cap per model, so a slow provider cannot
+  tie up every greenlet;
+- a deadline per call. Each attempt's read timeout is whatever remains of it,
+  and waiting for a concurrency slot counts against it too;
+- retries with full-jitter exponential backoff on 429, 5xx and connection
+  errors. `Retry-After` is honoured when it fits inside the deadline;
+- a circuit breaker. After repeated failures, calls fail fast with
+  `LLMUnavailable` for a cooldown, so callers serve their cached or fallback
+  response right away instead of queueing behind a degraded provider;
+- token and latency counters per call site (`llm.stats()`, and on /metrics).
+"""
+import json
+import logging
+import os
+import random
+import time
+
+import gevent
+import requests
+from gevent.lock import BoundedSemaphore
+from dotenv import load_dotenv, find_dotenv
+from requests.adapters import HTTPAdapter
+
+from services.metrics import LLM_TOKENS, record_upstream
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", "8"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "45"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+
+class LLMError(Exception):
+    """The call failed (bad status, malformed body, or retries exhausted)."""
+
+
+class LLMUnavailable(LLMError):
+    """The call was not attempted: circuit open, or no slot before the deadline."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures. While open, calls are
+    refused until `cooldown` has passed. After that, one probe call is let
+    through: success closes the breaker, failure reopens it.
+    """
+
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, cooldown=LLM_BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning("Circuit opened after %s failures", self.failures)
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record(self, latency, usage=None, ok=True):
+        self.calls += 1
+        if not ok:
+            self.failures += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        if usage:
+            self.prompt_tokens += usage.get("prompt_tokens") or 0
+            self.completion_tokens += usage.get("completion_tokens") or 0
+
+
+class LLMClient:
+    def __init__(self, base_url=OPENROUTER_BASE_URL, max_concurrency=LLM_MAX_CONCURRENCY,
+                 model_concurrency=LLM_MODEL_CONCURRENCY, deadline=LLM_DEADLINE_SECONDS,
+                 max_retries=LLM_MAX_RETRIES, breaker=None):
+        self.url = f"{base_url.rstrip('/')}/chat/completions"
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._slots = BoundedSemaphore(max_concurrency)
+        self._model_concurrency = model_concurrency
+        self._model_slots = {}
+        self._stats = {}
+
+    def stats(self):
+        """
+        Snapshot of the counters, keyed by call site.
+        """
+        snapshot = {}
+        for site, s in self._stats.items():
+            snapshot[site] = {
+                "calls": s.calls,
+                "failures": s.failures,
+                "rejected": s.rejected,
+                "retries": s.retries,
+                "prompt_tokens": s.prompt_tokens,
+                "completion_tokens": s.completion_tokens,
+                "latency_avg": s.latency_total / s.calls if s.calls else 0.0,
+                "latency_max": s.latency_max,
+            }
+        return snapshot
+
+    def _record(self, stats, call_site, latency, usage, ok):
+        stats.record(latency, usage, ok)
+        record_upstream("openrouter", call_site, latency, ok)
+        if usage:
+            LLM_TOKENS.labels(call_site, "prompt").inc(usage.get("prompt_tokens") or 0)
+            LLM_TOKENS.labels(call_site, "completion").inc(usage.get("completion_tokens") or 0)
+
+    def _site(self, call_site):
+        return self._stats.setdefault(call_site, CallStats())
+
+    def _acquire(self, model, expires):
+        """
+        Take the global slot and the model's slot, giving up at `expires`.
+        """
+        model_slot = self._model_slots.setdefault(model, BoundedSemaphore(self._model_concurrency))
+        if not self._slots.acquire(timeout=max(0.0, expires - time.monotonic())):
+            raise LLMUnavailable("no free LLM slot before the deadline")
+        if not model_slot.acquire(timeout=max(0.0, expires - time.monotonic())):
+            self._slots.release()
+            raise LLMUnavailable(f"no free slot for {model} before the deadline")
+        return model_slot
+
+    def _release(self, model_slot):
+        model_slot.release()
+        self._slots.release()
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def _post(self, stats, payload, headers, expires, stream=False):
+        """
+        POST with retries, all within the deadline. Returns an OK response.
+        """
+        attempt = 0
+        while True:
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                raise LLMError("deadline exceeded")
+            response = None
+            try:
+                response = self.session.post(
+                    self.url,
+                    json=payload,
+                    headers=headers,
+                    timeout=(min(LLM_CONNECT_TIMEOUT, remaining), remaining),
+                    stream=stream,
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    if response.status_code >= 400:
+                        raise LLMError(f"HTTP {response.status_code}: {response.text[:200]}")
+                    return response
+                reason = f"HTTP {response.status_code}"
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                reason = str(e)
+
+            wait = self._backoff(attempt, response)
+            if attempt >= self.max_retries or time.monotonic() + wait >= expires:
+                raise LLMError(f"giving up after {attempt + 1} attempts: {reason}")
+            attempt += 1
+            stats.retries += 1
+            gevent.sleep(wait)
+
+    def _headers(self, extra):
+        headers = {
+            "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
+            "Content-Type": "application/json",
+        }
+        headers.update(extra or {})
+        return headers
+
+    def _begin(self, call_site, model, expires):
+        """
+        Check the breaker and take the concurrency slots.
+        """
+        stats = self._site(call_site)
+        if not self.breaker.allow():
+            stats.rejected += 1
+            raise LLMUnavailable("LLM circuit is open")
+        try:
+            return stats, self._acquire(model, expires)
+        except LLMUnavailable:
+            # Saturation is not a provider failure; let the next call probe instead.
+            self.breaker._probing = False
+            stats.rejected += 1
+            raise
+
+    def chat(self, call_site, model, messages, deadline=None, headers=None, **params):
+        """
+        Run one chat completion and return the message content.
+
+        Raises `LLMUnavailable` without calling the provider when the circuit
+        is open, and `LLMError` when the call fails.
+        """
+        start = time.monotonic()
+        expires = start + (deadline or self.deadline)
+        stats, model_slot = self._begin(call_site, model, expires)
+        usage, ok = None, False
+        try:
+            payload = {"model": model, "messages": messages, **params}
+            response = self._post(stats, payload, self._headers(headers), expires)
+            try:
+                body = response.json()
+                content = body["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                raise LLMError(f"malformed response: {e}")
+            usage = body.get("usage")
+            ok = True
+            return content
+        finally:
+            self._release(model_slot)
+            (self.breaker.record_success if ok else self.breaker.record_failure)()
+            self._record(stats, call_site, time.monotonic() - start, usage, ok)
+
+    def stream_chat(self, call_site, model, messages, deadline=None, headers=None, **params):
+        """
+        Like `chat`, but yields the content deltas as they arrive. The slots
+        are held until the stream is finished or closed.
+        """
+        start = time.monotonic()
+        expires = start + (deadline or self.deadline)
+        stats, model_slot = self._begin(call_site, model, expires)
+        usage, ok = None, False
+        try:
+            payload = {"model": model, "messages": messages, "stream": True, **params}
+            with self._post(stats, payload, self._headers(headers), expires, stream=True) as response:
+                for raw in response.iter_lines(decode_unicode=True):
+                    # SSE frames: "data: {...}", "data: [DONE]", or ": keep-alive" comments
+                    if not raw or not raw.startswith("data:"):
+                        continue
+                    data = raw[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError as e:
+                        raise LLMError(f"malformed stream chunk: {e}")
+                    usage = chunk.get("usage") or usage
+                    choices = chunk.get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+                    if time.monotonic() >= expires:
+                        raise LLMError("deadline exceeded while streaming")
+            ok = True
+        except GeneratorExit:
+            # The consumer stopped reading; that says nothing about the provider.
+            ok = True
+            raise
+        except requests.RequestException as e:
+            raise LLMError(str(e))
+        finally:
+            self._release(model_slot)
+            (self.breaker.record_success if ok else self.breaker.record_failure)()
+            self._record(stats, call_site, time.monotonic() - start, usage, ok)
+
+
+llm = LLMClient()
@@ -0,0 +1,194 @@
+"""
+Process-wide logging: non-blocking output, per-logger levels, and sampled
+debug logging for per-message events.
+
+`configure_logging()` routes every record through a queue to a writer
+running on a native OS thread, so a log call on a greenlet costs a queue
+put and never blocks the gevent hub on stdout. When more than
+`LOG_QUEUE_SIZE` records are pending, new ones are dropped and counted
+rather than buffered without bound.
+
+Configuration (environment):
+
+- LOG_LEVEL: root level, default INFO;
+- LOG_LEVELS: per-logger overrides, e.g. "server=DEBUG,services.polygon_proxy=DEBUG";
+- LOG_FORMAT: "text" (default) or "json", one object per line;
+- LOG_SAMPLE_PER_SECOND: lines per second each `SampledLog` lets through.
+
+Hot paths log through `SampledLog`. It costs one cached level check while
+its logger is above DEBUG:
+
+    log_forward = SampledLog(logger)
+    log_forward("Emitted update for %s to %d clients", symbol, total)
+"""
+import atexit
+import json
+import logging
+import os
+import sys
+import time
+from logging.handlers import QueueHandler
+
+from dotenv import load_dotenv
+from gevent import monkey
+
+load_dotenv()
+
+# Native primitives, even after monkey.patch_all()
+_start_native_thread = monkey.get_original("_thread", "start_new_thread")
+_allocate_native_lock = monkey.get_original("_thread", "allocate_lock")
+_NativeRLock = monkey.get_original("threading", "RLock")
+_NativeQueue = monkey.get_original("queue", "SimpleQueue")
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_PER_SECOND = float(os.getenv("LOG_SAMPLE_PER_SECOND", "10"))
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+FLUSH_TIMEOUT_SECONDS = 2
+
+_writer = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    `QueueHandler` that drops records once `maxsize` are waiting.
+    """
+
+    def __init__(self, queue, maxsize):
+        super().__init__(queue)
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.maxsize:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class LogWriter:
+    """
+    Drains the queue into `handler` on a native thread.
+    """
+
+    def __init__(self, handler, maxsize):
+        self.handler = handler
+        # The writer thread is the only user of the handler; give it a native
+        # lock, since gevent's would be shared across threads.
+        handler.lock = _NativeRLock()
+        self.queue = _NativeQueue()
+        self.queue_handler = DroppingQueueHandler(self.queue, maxsize)
+        self._done = None
+        self.start()
+
+    def start(self):
+        self._done = _allocate_native_lock()
+        self._done.acquire()
+        _start_native_thread(self._run, ())
+
+    def _run(self):
+        try:
+            while True:
+                record = self.queue.get()
+                if record is None:
+                    break
+                self._report_dropped()
+                self.handler.handle(record)
+        finally:
+            self._done.release()
+
+    def _report_dropped(self):
+        dropped, self.queue_handler.dropped = self.queue_handler.dropped, 0
+        if dropped:
+            self.handler.handle(logging.makeLogRecord({
+                "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "Dropped %d log records (queue full)", "args": (dropped,),
+            }))
+
+    def stop(self):
+        self.queue.put(None)
+        self._done.acquire(timeout=FLUSH_TIMEOUT_SECONDS)
+
+
+def parse_levels(spec):
+    """
+    "a=DEBUG,b.c=WARNING" -> {"a": "DEBUG", "b.c": "WARNING"}
+    """
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """
+    Install the queue handler on the root logger and apply LOG_LEVEL and
+    LOG_LEVELS. Safe to call more than once; only the first call does anything.
+    """
+    global _writer
+    if _writer is not None:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    _writer = LogWriter(handler, LOG_QUEUE_SIZE)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(_writer.queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    atexit.register(_writer.stop)
+    # A forked worker (gunicorn --preload) does not inherit the writer thread
+    os.register_at_fork(after_in_child=_writer.start)
+
+
+class SampledLog:
+    """
+    Debug logging for per-message events. Lets through at most `per_second`
+    lines each second and folds the rest into a "(+N suppressed)" count on
+    the next line that gets through.
+    """
+
+    def __init__(self, logger, per_second=LOG_SAMPLE_PER_SECOND):
+        self.logger = logger
+        self.per_second = per_second
+        self._window_end = 0.0
+        self._emitted = 0
+        self._suppressed = 0
+
+    def __call__(self, msg, *args):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        now = time.monotonic()
+        if now >= self._window_end:
+            self._window_end = now + 1.0
+            self._emitted = 0
+        if self._emitted >= self.per_second:
+            self._suppressed += 1
+            return
+        self._emitted += 1
+        if self._suppressed:
+            msg = f"{msg} (+{self._suppressed} suppressed)"
+            self._suppressed = 0
+        self.logger.debug(msg, *args)
@@ -0,0 +1,122 @@
+"""
+Prometheus metrics for upstream latency, app operations and live-update fan-out.
+
+Everything here is a plain `prometheus_client` counter or histogram. An
+observation is a dict lookup plus a few additions, with no I/O, and the
+library's locks are gevent-aware once `monkey.patch_all()` has run.
+
+    with observe("polygon", "aggs.prev"):    # one upstream call
+        ...
+
+    @timed("get_stock_data")                 # one app-level operation
+    def get_stock_data(...): ...
+
+With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory so `/metrics` aggregates every worker (gunicorn.conf.py clears
+each dead worker's files).
+"""
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_seconds",
+    "Latency of calls to Polygon, yfinance, OpenRouter, Redis and Postgres",
+    ["upstream", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total",
+    "Upstream calls that raised or returned an error status",
+    ["upstream", "operation"],
+)
+OPERATION_SECONDS = Histogram(
+    "operation_seconds",
+    "End-to-end latency of app operations",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported by the LLM provider",
+    ["call_site", "kind"],
+)
+SOCKETIO_EMITS = Counter(
+    "socketio_emits_total",
+    "Room emits of streamed aggregates",
+    ["format"],
+)
+SOCKETIO_RECIPIENTS = Counter(
+    "socketio_fanout_recipients_total",
+    "Client deliveries implied by room emits (subscribers per emit)",
+)
+STREAM_LAG_SECONDS = Histogram(
+    "stream_delivery_lag_seconds",
+    "Time from receiving an aggregate from Polygon to handing it on for emit",
+    buckets=LAG_BUCKETS,
+)
+
+
+def record_upstream(upstream, operation, seconds, ok=True):
+    UPSTREAM_SECONDS.labels(upstream, operation).observe(seconds)
+    if not ok:
+        UPSTREAM_ERRORS.labels(upstream, operation).inc()
+
+
+@contextmanager
+def observe(upstream, operation):
+    """
+    Time the enclosed upstream call; an exception also counts as an error.
+    """
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record_upstream(upstream, operation, time.perf_counter() - start, ok)
+
+
+def timed(operation):
+    """
+    Decorator recording the wrapped function's latency as `operation`.
+    """
+    histogram = OPERATION_SECONDS.labels(operation)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def render():
+    """
+    `(body, content_type)` for the /metrics endpoint.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
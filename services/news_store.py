@@ -0,0 +1,234 @@
+"""
+Incremental per-ticker news cache.
+
+Stock pages read news from Redis only. A background poller keeps it current
+by asking Polygon for articles published after the newest one we already
+have for each ticker.
+
+Redis layout:
+
+- `news:article:{id}`: one cleaned article, stored once however many
+  tickers it mentions;
+- `news:ticker:{SYMBOL}`: sorted set of article ids scored by publish time,
+  trimmed to the newest `NEWS_KEEP`. An article is added to the set of every
+  ticker it mentions;
+- `news:ticker:{SYMBOL}:meta`: hash of `last_published` (the `published_utc`
+  cursor) and `viewed_at`;
+- `news:tracked`: sorted set of symbols scored by when they are next due.
+
+The polling interval shrinks with popularity (`set_popularity`, the same hook
+the ticker index uses). Symbols nobody has viewed for `NEWS_IDLE_SECONDS`
+stop being polled. Each poll takes a short Redis lock, so several workers do
+not poll the same ticker at once.
+"""
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from datetime import datetime
+from itertools import islice
+
+import gevent
+import requests
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+from services.polygon_client import polygon
+
+logger = logging.getLogger(__name__)
+
+TRACKED_KEY = "news:tracked"
+ARTICLE_KEY = "news:article:{id}"
+TICKER_KEY = "news:ticker:{symbol}"
+META_KEY = "news:ticker:{symbol}:meta"
+POLL_LOCK_KEY = "news:poll:{symbol}"
+
+NEWS_KEEP = 20
+NEWS_PER_PAGE = 5
+ARTICLE_TTL = 14 * 24 * 3600
+NEWS_MIN_INTERVAL = int(os.getenv("NEWS_MIN_INTERVAL_SECONDS", "120"))
+NEWS_MAX_INTERVAL = int(os.getenv("NEWS_MAX_INTERVAL_SECONDS", "1800"))
+NEWS_IDLE_SECONDS = int(os.getenv("NEWS_IDLE_SECONDS", str(24 * 3600)))
+# Most articles taken from one poll (Polygon pages are followed up to this)
+NEWS_MAX_PER_POLL = 100
+POLL_TICK_SECONDS = 10
+POLL_BATCH = 20
+POLL_LOCK_TTL = 60
+
+# Deletes the poll lock only if we still own it.
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _published_ts(published_utc):
+    try:
+        return datetime.fromisoformat(published_utc.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return 0.0
+
+
+def clean_article(item):
+    return {
+        "id": item["id"],
+        "title": item.get("title", "Untitled"),
+        "summary": item.get("description", "No summary available."),
+        "url": item.get("article_url", "#"),
+        "sentiment": "Neutral",
+        "published_utc": item.get("published_utc", ""),
+        "tickers": item.get("tickers") or [],
+    }
+
+
+def fetch_news_since(symbol, last_published=None):
+    """
+    Articles about `symbol` newer than `last_published`, newest first.
+    """
+    params = {"ticker": symbol, "order": "desc", "sort": "published_utc", "limit": 50}
+    if last_published:
+        params["published_utc.gt"] = last_published
+    else:
+        params["limit"] = NEWS_KEEP
+    items = polygon.results("/v2/reference/news", params, endpoint="news")
+    limit = NEWS_MAX_PER_POLL if last_published else NEWS_KEEP
+    return [clean_article(item) for item in islice(items, limit) if item.get("id")]
+
+
+class NewsStore:
+    def __init__(self, redis_client=redis_conn):
+        self.redis = redis_client
+        self.popularity = {}
+        self._poller = None
+        self._release = None
+
+    def set_popularity(self, scores):
+        self.popularity = scores
+
+    def interval_for(self, symbol):
+        """
+        Seconds between polls: the maximum for unknown symbols, shrinking
+        logarithmically with popularity down to the minimum.
+        """
+        score = self.popularity.get(symbol, 0)
+        return max(NEWS_MIN_INTERVAL, NEWS_MAX_INTERVAL / (1 + math.log2(1 + score)))
+
+    # -- request path ----------------------------------------------------
+
+    def get_news(self, symbol, limit=NEWS_PER_PAGE):
+        """
+        Cached articles for `symbol`, newest first. Never calls Polygon; a
+        symbol seen for the first time is scheduled for an immediate poll.
+        """
+        symbol = symbol.upper()
+        self.start()
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zrevrange(TICKER_KEY.format(symbol=symbol), 0, limit - 1)
+            pipe.zadd(TRACKED_KEY, {symbol: time.time()}, nx=True)
+            pipe.hset(META_KEY.format(symbol=symbol), "viewed_at", time.time())
+            ids, newly_tracked, _ = pipe.execute()
+            if newly_tracked:
+                gevent.spawn(self.poll_symbol, symbol)
+            if not ids:
+                return []
+            raw = self.redis.mget([ARTICLE_KEY.format(id=i.decode()) for i in ids])
+        except RedisError as e:
+            logger.warning("Redis unavailable for %s: %s", symbol, e)
+            return []
+
+        articles = []
+        for r in raw:
+            if r is None:
+                continue
+            article = json.loads(r)
+            articles.append({k: article[k] for k in ("title", "summary", "url", "sentiment")})
+        return articles
+
+    # -- poller ----------------------------------------------------------
+
+    def store_articles(self, articles):
+        """
+        Save articles once each and index them under every ticker they mention.
+        """
+        if not articles:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        touched = set()
+        for article in articles:
+            pipe.set(ARTICLE_KEY.format(id=article["id"]), json.dumps(article), ex=ARTICLE_TTL)
+            score = _published_ts(article["published_utc"])
+            for ticker in article["tickers"]:
+                key = TICKER_KEY.format(symbol=ticker.upper())
+                pipe.zadd(key, {article["id"]: score})
+                touched.add(key)
+        for key in touched:
+            pipe.zremrangebyrank(key, 0, -(NEWS_KEEP + 1))
+            pipe.expire(key, ARTICLE_TTL)
+        pipe.execute()
+
+    def poll_symbol(self, symbol):
+        """
+        Fetch articles newer than the cursor for `symbol`, then reschedule it.
+        """
+        lock = POLL_LOCK_KEY.format(symbol=symbol)
+        meta_key = META_KEY.format(symbol=symbol)
+        token = uuid.uuid4().hex
+        try:
+            if not self.redis.set(lock, token, nx=True, ex=POLL_LOCK_TTL):
+                return
+        except RedisError as e:
+            logger.warning("Redis unavailable while polling %s: %s", symbol, e)
+            return
+        try:
+            meta = self.redis.hgetall(meta_key)
+            viewed_at = float(meta.get(b"viewed_at", 0))
+            if time.time() - viewed_at > NEWS_IDLE_SECONDS:
+                self.redis.zrem(TRACKED_KEY, symbol)
+                return
+
+            last = meta.get(b"last_published")
+            articles = fetch_news_since(symbol, last.decode() if last else None)
+            self.store_articles(articles)
+            if articles:
+                newest = max(articles, key=lambda a: _published_ts(a["published_utc"]))
+                self.redis.hset(meta_key, "last_published", newest["published_utc"])
+                logger.info("%s new articles for %s", len(articles), symbol)
+            self.redis.zadd(TRACKED_KEY, {symbol: time.time() + self.interval_for(symbol)})
+        except requests.RequestException as e:
+            logger.warning("Poll failed for %s: %s", symbol, e)
+            self.redis.zadd(TRACKED_KEY, {symbol: time.time() + NEWS_MIN_INTERVAL})
+        except RedisError as e:
+            logger.warning("Redis unavailable while polling %s: %s", symbol, e)
+        finally:
+            # A poll that outlived its lock must not delete the next holder's.
+            try:
+                if self._release is None:
+                    self._release = self.redis.register_script(_RELEASE_LOCK)
+                self._release(keys=[lock], args=[token])
+            except RedisError:
+                pass
+
+    def poll_due(self):
+        due = self.redis.zrangebyscore(TRACKED_KEY, "-inf", time.time(), start=0, num=POLL_BATCH)
+        jobs = [gevent.spawn(self.poll_symbol, s.decode()) for s in due]
+        gevent.joinall(jobs)
+
+    def _poll_forever(self):
+        while True:
+            try:
+                self.poll_due()
+            except RedisError as e:
+                logger.warning("Poller lost Redis: %s", e)
+            gevent.sleep(POLL_TICK_SECONDS)
+
+    def start(self):
+        if self._poller is None:
+            self._poller = gevent.spawn(self._poll_forever)
+
+
+news_store = NewsStore()
@@ -0,0 +1,126 @@
+"""
+Shared client for Polygon's REST API.
+
+Every REST call to Polygon goes through the `polygon` singleton, which has:
+
+- one keep-alive `requests.Session` whose pool is sized for many greenlets,
+  so repeat calls skip the TCP/TLS handshake;
+- default connect/read timeouts, so a hung upstream cannot block a greenlet
+  indefinitely;
+- `paginate` and `results`, generators that follow `next_url` (re-attaching
+  the API key, which Polygon leaves out of it);
+- call/error/latency counters per named endpoint (`polygon.stats()`, and
+  the `upstream_request_seconds` histogram on /metrics).
+
+Errors surface as `requests` exceptions (`HTTPError`, `Timeout`, ...), the
+same types the call sites handled before.
+"""
+import os
+import time
+
+import requests
+from dotenv import load_dotenv, find_dotenv
+from requests.adapters import HTTPAdapter
+
+from services.metrics import record_upstream
+
+load_dotenv(find_dotenv())
+
+POLYGON_BASE_URL = os.getenv("POLYGON_BASE_URL", "https://api.polygon.io")
+POLYGON_POOL_SIZE = int(os.getenv("POLYGON_POOL_SIZE", "50"))
+POLYGON_CONNECT_TIMEOUT = float(os.getenv("POLYGON_CONNECT_TIMEOUT", "5"))
+POLYGON_READ_TIMEOUT = float(os.getenv("POLYGON_READ_TIMEOUT", "15"))
+
+
+class EndpointStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record(self, latency, ok):
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+
+class PolygonClient:
+    def __init__(self, base_url=POLYGON_BASE_URL, pool_size=POLYGON_POOL_SIZE,
+                 timeout=(POLYGON_CONNECT_TIMEOUT, POLYGON_READ_TIMEOUT)):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._stats = {}
+
+    @staticmethod
+    def _api_key():
+        return os.getenv("POLYGON_API_KEY")
+
+    def _url(self, path):
+        return path if path.startswith("http") else f"{self.base_url}{path}"
+
+    def stats(self):
+        """
+        Snapshot of the counters, keyed by endpoint name.
+        """
+        return {
+            endpoint: {
+                "calls": s.calls,
+                "errors": s.errors,
+                "latency_avg": s.latency_total / s.calls if s.calls else 0.0,
+                "latency_max": s.latency_max,
+            }
+            for endpoint, s in self._stats.items()
+        }
+
+    def get(self, path, params=None, endpoint="other", timeout=None, check=True):
+        """
+        GET `path` (relative to the base URL, or absolute) with the API key
+        added. Raises `requests.HTTPError` on a non-2xx status unless `check`
+        is False.
+        """
+        params = {**(params or {}), "apiKey": self._api_key()}
+        stats = self._stats.setdefault(endpoint, EndpointStats())
+        start = time.monotonic()
+        ok = False
+        try:
+            response = self.session.get(self._url(path), params=params, timeout=timeout or self.timeout)
+            ok = response.ok
+            if check:
+                response.raise_for_status()
+            return response
+        finally:
+            latency = time.monotonic() - start
+            stats.record(latency, ok)
+            record_upstream("polygon", endpoint, latency, ok)
+
+    def get_json(self, path, params=None, endpoint="other", timeout=None, check=True):
+        return self.get(path, params, endpoint, timeout, check).json()
+
+    def paginate(self, path, params=None, endpoint="other", timeout=None):
+        """
+        Yield each response body, following `next_url` until it runs out.
+        """
+        url = path
+        while url:
+            body = self.get_json(url, params, endpoint, timeout)
+            yield body
+            # next_url already carries the cursor and the original query
+            url = body.get("next_url")
+            params = None
+
+    def results(self, path, params=None, endpoint="other", timeout=None):
+        """
+        Yield every item of `results` across all pages.
+        """
+        for body in self.paginate(path, params, endpoint, timeout):
+            yield from body.get("results") or []
+
+
+polygon = PolygonClient()
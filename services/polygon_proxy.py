@@ -1,56 +1,87 @@
 import asyncio
 import os
-import json
 from polygon.websocket.models import Feed, Market
 from polygon.websocket.models import WebSocketMessage
 from polygon import WebSocketClient
 from typing import List, Callable
 from dotenv import load_dotenv
+from services.subscription_manager import SubscriptionManager
+from services.conflator import Conflator
+from services.stream_log import StreamRecorder
+from services.metrics import STREAM_LAG_SECONDS
 
 load_dotenv()
 
 import logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-)
+from services.log_config import SampledLog
+
 logger = logging.getLogger(__name__)
+log_aggregate = SampledLog(logger)
 
 API_KEY = os.getenv("POLYGON_API_KEY")
 
-ws_client = WebSocketClient(
-    api_key=API_KEY,
-    feed=Feed.Delayed,
-    market=Market.Stocks
-)
+# POLYGON_WS_FEED overrides the feed host, e.g. "127.0.0.1:9102" with
+# POLYGON_WS_SECURE=false for the stand-in in benchmarks/fake_upstreams.py
+def new_ws_client() -> WebSocketClient:
+    return WebSocketClient(
+        api_key=API_KEY,
+        feed=os.getenv("POLYGON_WS_FEED", Feed.Delayed),
+        market=Market.Stocks,
+        secure=os.getenv("POLYGON_WS_SECURE", "true").lower() != "false",
+    )
+
+ws_client = new_ws_client()
 
 # List of subscriber callback functions (e.g., to broadcast via socket.io)
 subscribers: List[Callable[[WebSocketMessage], None]] = []
 
-subscribed_symbols: set[str] = set()
+# Per-symbol reference counts; channel changes are batched per tick and
+# released only after a grace period.
+subscriptions = SubscriptionManager(
+    ws_client,
+    tick=float(os.getenv("POLYGON_SUB_TICK_SECONDS", "0.25")),
+    grace=float(os.getenv("POLYGON_UNSUB_GRACE_SECONDS", "30")),
+)
 
 def subscribe_callback(cb: Callable[[WebSocketMessage], None]):
     subscribers.append(cb)
 
+def dispatch(m: WebSocketMessage):
+    for cb in subscribers:
+        cb(m)
+
+# Latest revision per (symbol, bar) is flushed to subscribers every interval
+conflator = Conflator(
+    dispatch,
+    interval=float(os.getenv("STREAM_CONFLATE_SECONDS", "0.25")),
+    observe_lag=STREAM_LAG_SECONDS.observe,
+)
+
+# Set POLYGON_RECORD_PATH to log every batch for benchmarks/stream_replay.py;
+# "{pid}" in the path keeps workers from writing to the same file
+RECORD_PATH = os.getenv("POLYGON_RECORD_PATH")
+recorder = StreamRecorder(RECORD_PATH.format(pid=os.getpid())) if RECORD_PATH else None
+
 def handle_msg(messages: List[WebSocketMessage]):
+    if recorder is not None:
+        recorder.record(messages)
     for m in messages:
-        print(m)
-        for cb in subscribers:
-            cb(m)
-
-def subscribe_symbol(symbol: str):
-    channel = f"AM.{symbol}"
-    if symbol not in subscribed_symbols:
-        ws_client.subscribe(channel)
-        subscribed_symbols.add(symbol)
-        logger.info(f"[Proxy] Subscribed to Polygon channel: {channel}")
-
-def unsubscribe_symbol(symbol: str):
-    channel = f"AM.{symbol}"
-    if symbol in subscribed_symbols:
-        ws_client.unsubscribe(channel)
-        subscribed_symbols.remove(symbol)
-        logger.info(f"[Proxy] Unsubscribed from Polygon channel: {channel}")
+        log_aggregate("Aggregate %s", m)
+        conflator.offer(m)
 
 def run_polygon_proxy():
-    ws_client.run(handle_msg)
\ No newline at end of file
+    ws_client.run(handle_msg)
+
+def stop_polygon_proxy():
+    """
+    Close the websocket so `run_polygon_proxy` returns, and put a fresh client
+    with no channels in its place, so the next run subscribes from scratch.
+    """
+    global ws_client
+    old, ws_client = ws_client, new_ws_client()
+    subscriptions.ws_client = ws_client
+    old.unsubscribe_all()
+    websocket = old.websocket
+    if websocket is not None:
+        # The connection lives on the event loop inside run_polygon_proxy
+        asyncio.run_coroutine_threadsafe(old.close(), websocket.loop)
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+Decayed per-symbol popularity, shared across workers.
+
+Hits are counted in memory on the request path: `record()` never touches
+Redis. A background greenlet flushes the counts every `FLUSH_SECONDS` as one
+pipeline of ZINCRBYs into hourly bucket sets (`pop:bucket:{n}`), which expire
+once they leave the window.
+
+A symbol's score is the sum of its bucket counts, each weighted by
+`0.5 ** (age / HALF_LIFE)`, so a burst of interest fades over hours instead
+of counting forever. The top of the ranking is recomputed with one weighted
+ZUNIONSTORE every `REFRESH_SECONDS` and pushed to every registered listener:
+the ticker index, the news poller and the cache warmer all take a
+`set_popularity(scores)` dict.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+
+import gevent
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY = "pop:bucket:{bucket}"
+RANKING_KEY = "pop:ranking"
+
+BUCKET_SECONDS = 3600
+WINDOW_BUCKETS = int(os.getenv("POPULARITY_WINDOW_HOURS", "48"))
+HALF_LIFE_SECONDS = float(os.getenv("POPULARITY_HALF_LIFE_HOURS", "6")) * 3600
+FLUSH_SECONDS = float(os.getenv("POPULARITY_FLUSH_SECONDS", "5"))
+REFRESH_SECONDS = float(os.getenv("POPULARITY_REFRESH_SECONDS", "60"))
+TOP_SIZE = 500
+HOT_SIZE = 50
+
+# Relative weight of each kind of hit
+WEIGHTS = {"stock": 1.0, "subscribe": 1.0, "history": 0.5, "suggest": 0.25}
+
+_SYMBOL_RE = re.compile(r"^[A-Z][A-Z0-9.\-]{0,9}$")
+
+
+class PopularityTracker:
+    def __init__(self, redis_client=redis_conn):
+        self.redis = redis_client
+        self.pending = Counter()
+        self.scores = {}
+        self.ranking = []
+        self.listeners = []
+        self._flusher = None
+        self._refresher = None
+
+    # -- request path ----------------------------------------------------
+
+    def record(self, symbol, kind="stock"):
+        """
+        Count one hit for `symbol`. In-memory only; flushed in the background.
+        """
+        symbol = (symbol or "").strip().upper()
+        if not _SYMBOL_RE.match(symbol):
+            return
+        self.pending[symbol] += WEIGHTS.get(kind, 1.0)
+        if self._flusher is None:
+            self._flusher = gevent.spawn(self._flush_forever)
+
+    # -- reads -----------------------------------------------------------
+
+    def top(self, n=HOT_SIZE):
+        """
+        The `n` most popular symbols as `(symbol, score)`, best first.
+        """
+        return self.ranking[:n]
+
+    def ttl_factor(self, symbol):
+        """
+        Multiplier for cache freshness: hot symbols refresh twice as often,
+        symbols outside the ranking keep their values twice as long.
+        """
+        if symbol in self.scores:
+            return 0.5 if self.scores[symbol] >= self._hot_threshold else 1.0
+        return 2.0
+
+    @property
+    def _hot_threshold(self):
+        if len(self.ranking) < HOT_SIZE:
+            return self.ranking[-1][1] if self.ranking else float("inf")
+        return self.ranking[HOT_SIZE - 1][1]
+
+    def add_listener(self, fn):
+        """
+        Call `fn(scores)` after every refresh, e.g. `ticker_index.set_popularity`.
+        """
+        self.listeners.append(fn)
+
+    # -- background ------------------------------------------------------
+
+    def flush(self):
+        if not self.pending:
+            return
+        counts, self.pending = self.pending, Counter()
+        key = BUCKET_KEY.format(bucket=int(time.time() // BUCKET_SECONDS))
+        pipe = self.redis.pipeline(transaction=False)
+        for symbol, count in counts.items():
+            pipe.zincrby(key, count, symbol)
+        pipe.expire(key, (WINDOW_BUCKETS + 1) * BUCKET_SECONDS)
+        pipe.execute()
+
+    def refresh(self):
+        """
+        Recompute the decayed ranking and notify listeners.
+        """
+        now_bucket = int(time.time() // BUCKET_SECONDS)
+        weights = {
+            BUCKET_KEY.format(bucket=now_bucket - age): 0.5 ** (age * BUCKET_SECONDS / HALF_LIFE_SECONDS)
+            for age in range(WINDOW_BUCKETS)
+        }
+        pipe = self.redis.pipeline()
+        pipe.zunionstore(RANKING_KEY, weights)
+        pipe.zrevrange(RANKING_KEY, 0, TOP_SIZE - 1, withscores=True)
+        _, ranked = pipe.execute()
+
+        self.ranking = [(sym.decode(), score) for sym, score in ranked]
+        self.scores = dict(self.ranking)
+        for listener in self.listeners:
+            try:
+                listener(self.scores)
+            except Exception as e:
+                logger.exception("Listener failed: %s", e)
+
+    def _flush_forever(self):
+        while True:
+            gevent.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except RedisError as e:
+                # Dropping a few seconds of counts is fine; do not let them pile up.
+                logger.warning("Flush failed: %s", e)
+
+    def _refresh_forever(self):
+        while True:
+            try:
+                self.refresh()
+            except RedisError as e:
+                logger.warning("Refresh failed: %s", e)
+            gevent.sleep(REFRESH_SECONDS)
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = gevent.spawn(self._flush_forever)
+        if self._refresher is None:
+            self._refresher = gevent.spawn(self._refresh_forever)
+
+
+popularity = PopularityTracker()
@@ -0,0 +1,232 @@
+"""
+Prev-day quotes for many symbols at once.
+
+Polygon's grouped-daily endpoint returns one day's bar for every US ticker
+in a single call. We load it once per trading day, write each bar to its own
+Redis key (`quote:{day}:{SYMBOL}`), and answer batch requests with one MGET.
+A 50-symbol watchlist therefore costs at most one upstream call per day,
+shared by every worker.
+
+Each day's load state is kept in `quotes:grouped:{day}`: "1" once loaded,
+"0" while Polygon has nothing for that day (a holiday, or a session whose
+aggregates are not published yet). In that case we fall back to the day
+before. Symbols the grouped bars do not cover are looked up together in one
+snapshot call.
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import requests
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+from cache.single_flight import single_flight
+from services.polygon_client import polygon
+from services.stock_aggregator import MARKET_TZ, price_fields
+
+logger = logging.getLogger(__name__)
+
+QUOTE_KEY = "quote:{day}:{symbol}"
+GROUPED_KEY = "quotes:grouped:{day}"
+
+# Long enough to span a weekend plus a holiday
+QUOTE_TTL = 5 * 24 * 3600
+# How long to wait before asking Polygon again about a day that had no data
+EMPTY_DAY_TTL = 15 * 60
+# Most recent sessions to try before giving up
+MAX_LOOKBACK_DAYS = 7
+
+MAX_BATCH_SYMBOLS = int(os.getenv("QUOTE_BATCH_MAX_SYMBOLS", "200"))
+WRITE_CHUNK = 1000
+
+# Regular-session close; grouped bars for a day only exist after it
+SESSION_CLOSE_HOUR = 16
+
+# Per-process memo of the current quote day, so most requests skip the lookup
+_current_day = {"day": None, "until": 0.0}
+DAY_MEMO_SECONDS = 60
+
+
+def recent_sessions(now=None):
+    """
+    Weekdays whose regular session has closed, most recent first.
+    """
+    now = now or datetime.now(MARKET_TZ)
+    day = now.date()
+    if now.hour < SESSION_CLOSE_HOUR:
+        day -= timedelta(days=1)
+    for _ in range(MAX_LOOKBACK_DAYS):
+        while day.weekday() >= 5:
+            day -= timedelta(days=1)
+        yield day.isoformat()
+        day -= timedelta(days=1)
+
+
+def quote_key(day, symbol):
+    return QUOTE_KEY.format(day=day, symbol=symbol.upper())
+
+
+def normalize_symbols(symbols):
+    """
+    Upper-case and de-duplicate a symbol list, keeping order.
+    """
+    seen = []
+    for sym in symbols:
+        sym = sym.strip().upper()
+        if sym and sym not in seen:
+            seen.append(sym)
+    return seen
+
+
+def fetch_grouped_daily(day):
+    """
+    Every ticker's bar for `day` as `{SYMBOL: {o, h, l, c, v, t}}`.
+    """
+    body = polygon.get_json(
+        f"/v2/aggs/grouped/locale/us/market/stocks/{day}",
+        {"adjusted": "true"},
+        endpoint="aggs.grouped",
+        timeout=30,
+    )
+    return {
+        r["T"]: {k: r.get(k) for k in ("o", "h", "l", "c", "v", "t")}
+        for r in body.get("results") or []
+        if r.get("T")
+    }
+
+
+@single_flight("grouped", key=lambda day, redis_client=redis_conn: day, lock_ttl=120)
+def load_grouped_day(day, redis_client=redis_conn):
+    """
+    Load `day` into the quote cache. Returns True if Polygon had bars for it.
+    """
+    bars = fetch_grouped_daily(day)
+    marker = GROUPED_KEY.format(day=day)
+    if not bars:
+        redis_client.set(marker, "0", ex=EMPTY_DAY_TTL)
+        return False
+
+    items = list(bars.items())
+    for i in range(0, len(items), WRITE_CHUNK):
+        pipe = redis_client.pipeline(transaction=False)
+        for symbol, bar in items[i:i + WRITE_CHUNK]:
+            pipe.set(quote_key(day, symbol), json.dumps(bar), ex=QUOTE_TTL)
+        pipe.execute()
+    redis_client.set(marker, "1", ex=QUOTE_TTL)
+    logger.info("Loaded %s grouped bars for %s", len(bars), day)
+    return True
+
+
+def current_quote_day(redis_client=redis_conn):
+    """
+    The most recent session whose bars are in the quote cache, loading it
+    from Polygon if needed. None if no recent session has data.
+    """
+    if _current_day["day"] and time.time() < _current_day["until"]:
+        return _current_day["day"]
+
+    for day in recent_sessions():
+        state = redis_client.get(GROUPED_KEY.format(day=day))
+        if state == b"0":
+            continue
+        if state == b"1" or load_grouped_day(day, redis_client):
+            _current_day.update(day=day, until=time.time() + DAY_MEMO_SECONDS)
+            return day
+    return None
+
+
+def fetch_snapshot_prev(symbols):
+    """
+    Prev-day bars for specific symbols from one snapshot call, for symbols
+    the grouped load did not cover.
+    """
+    body = polygon.get_json(
+        "/v2/snapshot/locale/us/markets/stocks/tickers",
+        {"tickers": ",".join(symbols)},
+        endpoint="snapshot.tickers",
+    )
+    return {
+        t["ticker"]: {k: t["prevDay"].get(k) for k in ("o", "h", "l", "c", "v")}
+        for t in body.get("tickers") or []
+        if t.get("ticker") and t.get("prevDay")
+    }
+
+
+def fill_misses(day, bars, redis_client=redis_conn):
+    """
+    Look up symbols with no cached bar in one snapshot call and cache what
+    comes back. Updates `bars` in place.
+    """
+    # `{}` marks a symbol already known to have no bar
+    misses = [s for s, bar in bars.items() if bar is None]
+    if not misses:
+        return bars
+    try:
+        found = fetch_snapshot_prev(misses)
+    except requests.RequestException as e:
+        logger.warning("Snapshot fallback failed: %s", e)
+        return bars
+    if day:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for symbol in misses:
+                if symbol in found:
+                    pipe.set(quote_key(day, symbol), json.dumps(found[symbol]), ex=QUOTE_TTL)
+                else:
+                    pipe.set(quote_key(day, symbol), "{}", ex=EMPTY_DAY_TTL)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning("Could not cache snapshot bars: %s", e)
+    bars.update((s, found[s]) for s in misses if s in found)
+    return bars
+
+
+def read_quotes(day, symbols, redis_client=redis_conn):
+    """
+    Cached bars for `symbols` on `day` in one MGET: `{SYMBOL: bar or None}`.
+    """
+    if not symbols:
+        return {}
+    raw = redis_client.mget([quote_key(day, s) for s in symbols])
+    return {s: json.loads(r) if r is not None else None for s, r in zip(symbols, raw)}
+
+
+def shape_quote(symbol, bar):
+    """
+    Same price fields as /api/stock/<symbol>.
+    """
+    return {"symbol": symbol, **price_fields(bar)}
+
+
+def get_quotes(symbols, redis_client=redis_conn):
+    """
+    Prev-day quotes for `symbols`: `{"date", "quotes", "missing"}`, with
+    quotes in request order.
+    """
+    symbols = normalize_symbols(symbols)
+    try:
+        day = current_quote_day(redis_client)
+        bars = read_quotes(day, symbols, redis_client) if day else dict.fromkeys(symbols)
+        fill_misses(day, bars, redis_client)
+    except requests.RequestException as e:
+        logger.warning("Grouped fetch failed: %s", e)
+        day, bars = None, fill_misses(None, dict.fromkeys(symbols), redis_client)
+    except RedisError as e:
+        # No shared cache: answer straight from one grouped call
+        logger.warning("Redis unavailable, fetching grouped bars directly: %s", e)
+        day = next(recent_sessions())
+        try:
+            grouped = fetch_grouped_daily(day)
+        except requests.RequestException as err:
+            logger.warning("Grouped fetch failed: %s", err)
+            grouped = {}
+        bars = {s: grouped.get(s) for s in symbols}
+
+    return {
+        "date": day,
+        "quotes": [shape_quote(s, bars[s]) for s in symbols if bars.get(s)],
+        "missing": [s for s in symbols if not bars.get(s)],
+    }
@@ -0,0 +1,227 @@
+"""
+Assembles the /api/stock/<symbol> payload.
+
+The Polygon prev-day aggregate, the yfinance `.info` scrape and the news
+cache read do not depend on each other, so they run side by side on the
+gevent hub in a small per-request pool. The AI summary needs the Yahoo
+overview, so it starts as soon as the single `.info` result is back while the
+other fetches are still in flight.
+"""
+import logging
+import os
+from datetime import datetime, time as dtime, timedelta
+from zoneinfo import ZoneInfo
+from gevent.pool import Pool
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from cache.single_flight import SingleFlight
+from cache.tiered_cache import TieredCache
+from services.summary_generator import generate_ai_summary, summary_cache
+from services.financials import interpret_financials
+from services.polygon_client import polygon
+from services.news_store import news_store
+from services.popularity import popularity
+from services.yahoo_client import fetch_yf_info, map_yahoo_overview
+
+logger = logging.getLogger(__name__)
+
+# Greenlets per request: prev OHLC, yfinance info and news.
+FANOUT_POOL_SIZE = int(os.getenv("STOCK_FANOUT_POOL_SIZE", "3"))
+
+MARKET_TZ = ZoneInfo("America/New_York")
+SESSION_OPEN = dtime(9, 30)
+
+def seconds_until_next_session(now=None) -> float:
+    """
+    Seconds until the next regular session opens (09:30 ET, Mon-Fri).
+    Exchange holidays are not modelled; the prev-day bar just refreshes a day early.
+    """
+    now = now or datetime.now(MARKET_TZ)
+    candidate = datetime.combine(now.date(), SESSION_OPEN, tzinfo=MARKET_TZ)
+    if candidate <= now:
+        candidate += timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+    return (candidate - now).total_seconds()
+
+# field class -> (fresh seconds, extra seconds an entry may be served stale)
+STOCK_CACHE_POLICIES = {
+    "ohlc": (seconds_until_next_session, 3 * 24 * 3600),
+    "fundamentals": (6 * 3600, 24 * 3600),
+}
+
+stock_cache = TieredCache(
+    "stock",
+    STOCK_CACHE_POLICIES,
+    max_local_entries=int(os.getenv("STOCK_CACHE_LOCAL_MAX", "2048")),
+    # Fundamentals refresh more often for hot symbols and less for cold ones;
+    # the prev-day bar always lasts until the next session.
+    ttl_scale=lambda field_class, key: popularity.ttl_factor(key) if field_class == "fundamentals" else 1.0,
+)
+
+# Coalesces upstream fetches on a `stock_cache` miss, so warm hits never touch the lock.
+stock_flight = SingleFlight("stock")
+
+def format_large_number(num):
+    try:
+        num = float(num)
+        for unit in ['', 'K', 'M', 'B', 'T']:
+            if abs(num) < 1000.0:
+                return f"{num:.1f} {unit}".strip()
+            num /= 1000.0
+        return f"{num:.1f} P"
+    except:
+        return "-"
+
+def fetch_prev_ohlc(symbol: str) -> dict:
+    body = polygon.get_json(
+        f"/v2/aggs/ticker/{symbol.upper()}/prev",
+        {"adjusted": "true"},
+        endpoint="aggs.prev",
+        check=False,
+    )
+    return body.get("results", [{}])[0]
+
+def price_fields(ohlc_data: dict) -> dict:
+    """
+    Open/high/low/close, volume and change figures from a Polygon aggregate.
+    """
+    open_price = ohlc_data.get("o", "-")
+    high_price = ohlc_data.get("h", "-")
+    low_price = ohlc_data.get("l", "-")
+    close_price = ohlc_data.get("c", "-")
+    volume = ohlc_data.get("v", "-")
+
+    return {
+        "open": open_price,
+        "high": high_price,
+        "low": low_price,
+        "close": close_price,
+        "volume": format_large_number(volume),
+        "change": (
+            round(close_price - open_price, 2)
+            if isinstance(open_price, (int, float)) and isinstance(close_price, (int, float))
+            else "-"
+        ),
+        "percent_change": (
+            f"{round(((close_price - open_price) / open_price) * 100, 2)}%"
+            if isinstance(open_price, (int, float)) and open_price != 0 and isinstance(close_price, (int, float))
+            else "-"
+        ),
+    }
+
+def category_tags_for(fin_summary) -> list:
+    category_tags = []
+    if 'pays_dividends' in fin_summary:
+        category_tags.append("Dividend Lovers")
+    if 'high_pe' in fin_summary or 'high_beta' in fin_summary:
+        category_tags.append("High Growth")
+    if 'low_beta' in fin_summary or 'low_pe' in fin_summary:
+        category_tags.append("Safe Picks")
+    return category_tags
+
+def summarize(yahoo_overview: dict, symbol: str):
+    # Generate AI summary, but handle Redis connection issues gracefully
+    try:
+        return generate_ai_summary(yahoo_overview, symbol)
+    except RedisConnectionError as e:
+        logger.warning("Redis connection unavailable for summary: %s", e)
+        return ""
+    except Exception as e:
+        logger.exception("Summary generation error: %s", e)
+        return ""
+
+def cached_summary(yahoo_overview: dict, symbol: str):
+    # Cache-only lookup for deferred summaries; never calls the model
+    try:
+        return summary_cache.peek(symbol, yahoo_overview)
+    except Exception as e:
+        logger.exception("Summary cache lookup error: %s", e)
+        return None
+
+def interpret(yahoo_overview: dict) -> list:
+    # Interpret financials, handle Redis issues
+    try:
+        return interpret_financials(yahoo_overview)
+    except RedisConnectionError as e:
+        logger.warning("Redis connection unavailable for financial interpretation: %s", e)
+        return []
+    except Exception as e:
+        logger.exception("Financial interpretation error: %s", e)
+        return []
+
+def cached_prev_ohlc(symbol: str) -> dict:
+    return stock_cache.get_or_fetch(
+        "ohlc", symbol, lambda: stock_flight.do(f"ohlc:{symbol}", lambda: fetch_prev_ohlc(symbol))
+    )
+
+def cached_yf_info(symbol: str) -> dict:
+    return stock_cache.get_or_fetch(
+        "fundamentals", symbol, lambda: stock_flight.do(f"fundamentals:{symbol}", lambda: fetch_yf_info(symbol))
+    )
+
+def cached_news(symbol: str) -> list:
+    # Kept current by the news poller (services/news_store.py); no upstream call here
+    return news_store.get_news(symbol)
+
+def build_stock_payload(symbol, ohlc_data, tk_info, yahoo_overview, summary, news) -> dict:
+    symbol = symbol.upper()
+
+    # Determine if ETF and set sector accordingly
+    is_etf = tk_info.get('quoteType') == 'ETF'
+    sector_value = 'ETF' if is_etf else tk_info.get('sector', '-')
+
+    return {
+        "symbol": symbol,
+        "name": tk_info.get("longName", symbol),
+        "sector": sector_value,
+        "market_cap": tk_info.get("marketCap", "-"),
+        "pe_ratio": tk_info.get("trailingPE", "-"),
+        "ai_summary": summary,
+        "categoryTags": category_tags_for(interpret(yahoo_overview)),
+        "news": news,
+        **price_fields(ohlc_data),
+        # Merge Yahoo overview fields into the response
+        **yahoo_overview,
+    }
+
+def assemble_stock_data(symbol: str, defer_summary: bool = False) -> dict:
+    """
+    Fetch every upstream for `symbol` concurrently and build the response.
+
+    Each fragment goes through `stock_cache`, so a repeat view of a warm
+    symbol makes no upstream calls, and stale fragments are served at once
+    while they refresh in the background. Latency tracks the slowest branch
+    (prev OHLC, or `.info` followed by the summary) instead of the sum
+    of all calls. News comes from the incrementally polled news cache. Errors from the Polygon
+    aggregate propagate so the route can answer 500, as before. On a cache
+    miss, concurrent requests for the same fragment, in this or another
+    worker, share one upstream call (the summary has its own lock).
+
+    With `defer_summary`, a summary that is not already cached is left out
+    (`ai_summary: null`) and `ai_summary_stream` points at the SSE route that
+    streams it, so the page does not wait on the model.
+    """
+    symbol = symbol.upper()
+    pool = Pool(FANOUT_POOL_SIZE)
+    ohlc_job = pool.spawn(cached_prev_ohlc, symbol)
+    info_job = pool.spawn(cached_yf_info, symbol)
+    news_job = pool.spawn(cached_news, symbol)
+    try:
+        # One `.info` scrape feeds both the overview mapping and name/sector/marketCap.
+        tk_info = info_job.get()
+        yahoo_overview = map_yahoo_overview(tk_info) if tk_info else {}
+        # Summaries have their own versioned cache (cache/summary_cache.py)
+        if defer_summary:
+            summary = cached_summary(yahoo_overview, symbol)
+        else:
+            summary = summarize(yahoo_overview, symbol)
+        ohlc_data = ohlc_job.get()
+        news = news_job.get()
+    finally:
+        pool.kill(block=False)
+
+    payload = build_stock_payload(symbol, ohlc_data, tk_info, yahoo_overview, summary, news)
+    if defer_summary and not summary:
+        payload["ai_summary_stream"] = f"/api/stock/{symbol}/summary/stream"
+    return payload
@@ -0,0 +1,225 @@
+"""
+Shared upstream feed for running several web workers (STREAM_MODE=shared).
+
+Exactly one process, elected through a Redis lease, owns the Polygon
+websocket. It publishes every (conflated) aggregate to a Redis pub/sub
+channel, and every worker, the leader included, fans that out to its own
+Socket.IO clients.
+
+Upstream demand travels the other way. Each worker keeps the symbols its
+clients watch in a Redis set, using a `DemandPublisher` in place of the
+websocket client in its `SubscriptionManager`. The leader merges all workers'
+sets into its own upstream manager, with each worker as one holder, so a
+symbol stays subscribed while any worker still needs it.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from types import SimpleNamespace
+
+import gevent
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+
+logger = logging.getLogger(__name__)
+
+STREAM_MODE = os.getenv("STREAM_MODE", "local")
+
+LEADER_KEY = "stream:leader"
+WORKERS_KEY = "stream:workers"
+AGGREGATE_CHANNEL = "stream:aggs"
+DEMAND_CHANNEL = "stream:demand"
+
+LEADER_TTL = int(os.getenv("STREAM_LEADER_TTL_SECONDS", "15"))
+# A worker that has not heartbeated for this long no longer holds demand.
+DEMAND_TTL = 4 * LEADER_TTL
+# How long a leader that stepped down waits for the feed to close cleanly.
+UPSTREAM_STOP_TIMEOUT = 5
+
+# Extends the lease only if we still hold it.
+_RENEW_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def demand_key(worker_id):
+    return f"stream:demand:{worker_id}"
+
+
+class DemandPublisher:
+    """
+    Stands in for the Polygon websocket client inside a worker's
+    `SubscriptionManager`: channel changes become edits to this worker's
+    demand set plus a notification to the leader.
+    """
+
+    def __init__(self, worker_id, redis_client=redis_conn):
+        self.worker_id = worker_id
+        self.redis = redis_client
+
+    def _apply(self, op, channels):
+        symbols = [c.split(".", 1)[1] for c in channels]
+        key = demand_key(self.worker_id)
+        try:
+            pipe = self.redis.pipeline()
+            getattr(pipe, op)(key, *symbols)
+            pipe.expire(key, DEMAND_TTL)
+            pipe.zadd(WORKERS_KEY, {self.worker_id: time.time()})
+            pipe.publish(DEMAND_CHANNEL, self.worker_id)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning("Could not publish demand change: %s", e)
+
+    def subscribe(self, *channels):
+        self._apply("sadd", channels)
+
+    def unsubscribe(self, *channels):
+        self._apply("srem", channels)
+
+    def heartbeat(self):
+        pipe = self.redis.pipeline()
+        pipe.expire(demand_key(self.worker_id), DEMAND_TTL)
+        pipe.zadd(WORKERS_KEY, {self.worker_id: time.time()})
+        pipe.execute()
+
+
+class StreamBus:
+    def __init__(self, redis_client=redis_conn):
+        self.redis = redis_client
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.demand = DemandPublisher(self.worker_id, redis_client)
+        self.is_leader = False
+        self._renew = None
+        self._leader_greenlets = []
+
+    # -- leader side -----------------------------------------------------
+
+    def publish_aggregate(self, msg):
+        if not hasattr(msg, "symbol"):
+            return
+        try:
+            self.redis.publish(AGGREGATE_CHANNEL, json.dumps(msg.__dict__, default=str))
+        except RedisError as e:
+            logger.warning("Could not publish aggregate: %s", e)
+
+    def reconcile_demand(self, upstream):
+        """
+        Make `upstream` (the leader's SubscriptionManager) hold exactly the
+        symbols each live worker currently asks for.
+        """
+        cutoff = time.time() - DEMAND_TTL
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(WORKERS_KEY, "-inf", cutoff)
+        pipe.zrange(WORKERS_KEY, 0, -1)
+        workers = [w.decode() for w in pipe.execute()[1]]
+
+        pipe = self.redis.pipeline()
+        for worker in workers:
+            pipe.smembers(demand_key(worker))
+        wanted = {
+            worker: {s.decode() for s in symbols}
+            for worker, symbols in zip(workers, pipe.execute())
+        }
+
+        for worker in set(upstream.index.by_sid) - set(wanted):
+            upstream.release_all(worker)
+        for worker, symbols in wanted.items():
+            held = set(upstream.index.by_sid.get(worker, ()))
+            for symbol in symbols - held:
+                upstream.acquire(worker, symbol)
+            for symbol in held - symbols:
+                upstream.release(worker, symbol)
+
+    def _follow_demand(self, upstream):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(DEMAND_CHANNEL)
+                self.reconcile_demand(upstream)
+                while True:
+                    # Wake on a change notification, or periodically to drop dead workers.
+                    pubsub.get_message(timeout=LEADER_TTL)
+                    while pubsub.get_message(timeout=0) is not None:
+                        pass
+                    self.reconcile_demand(upstream)
+            except RedisError as e:
+                logger.warning("Demand follower lost Redis: %s", e)
+                gevent.sleep(1)
+            finally:
+                pubsub.close()
+
+    def _become_leader(self, run_upstream, upstream):
+        self.is_leader = True
+        logger.info("%s is now the upstream leader", self.worker_id)
+        self._leader_greenlets = [
+            gevent.spawn(run_upstream),
+            gevent.spawn(self._follow_demand, upstream),
+        ]
+
+    def _step_down(self, stop_upstream, upstream):
+        """
+        Close the feed and forget what it was subscribed to, so that winning
+        the lease again starts from an empty upstream and resubscribes.
+        """
+        self.is_leader = False
+        logger.warning("%s lost upstream leadership", self.worker_id)
+        feed, followers = self._leader_greenlets[:1], self._leader_greenlets[1:]
+        # Stop following demand first, so nothing is resubscribed meanwhile.
+        gevent.killall(followers)
+        if stop_upstream is not None:
+            stop_upstream()
+        upstream.reset()
+        gevent.joinall(feed, timeout=UPSTREAM_STOP_TIMEOUT)
+        gevent.killall(feed, block=False)
+        self._leader_greenlets = []
+
+    def _elect(self, run_upstream, stop_upstream, upstream):
+        while True:
+            try:
+                if self.is_leader:
+                    if self._renew is None:
+                        self._renew = self.redis.register_script(_RENEW_LEASE)
+                    if not self._renew(keys=[LEADER_KEY], args=[self.worker_id, LEADER_TTL]):
+                        self._step_down(stop_upstream, upstream)
+                elif self.redis.set(LEADER_KEY, self.worker_id, nx=True, ex=LEADER_TTL):
+                    self._become_leader(run_upstream, upstream)
+                self.demand.heartbeat()
+            except RedisError as e:
+                logger.warning("Leader election failed: %s", e)
+            gevent.sleep(LEADER_TTL / 3)
+
+    # -- worker side -----------------------------------------------------
+
+    def _listen(self, on_aggregate):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(AGGREGATE_CHANNEL)
+                for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    try:
+                        on_aggregate(SimpleNamespace(**json.loads(message["data"])))
+                    except Exception as e:
+                        logger.warning("Dropped aggregate: %s", e)
+            except RedisError as e:
+                logger.warning("Aggregate listener lost Redis: %s", e)
+                gevent.sleep(1)
+            finally:
+                pubsub.close()
+
+    def start(self, run_upstream, upstream, on_aggregate, stop_upstream=None):
+        """
+        Run the election loop and the local fan-out listener in the background.
+        `run_upstream` is only started while this process holds the lease;
+        `stop_upstream` makes it return when the lease is lost.
+        """
+        gevent.spawn(self._listen, on_aggregate)
+        gevent.spawn(self._elect, run_upstream, stop_upstream, upstream)
@@ -0,0 +1,22 @@
+"""
+Wire formats for streamed aggregate updates.
+
+"full" is the legacy payload: every field of the Polygon message as a dict.
+"compact" is a positional array with only what the chart needs:
+
+    [symbol, start_ms, end_ms, open, high, low, close, volume]
+
+Clients opt in to compact frames by connecting with `auth.format = "compact"`
+and then receive them as the `u` event instead of `update`.
+"""
+
+COMPACT_FIELDS = ("symbol", "start_timestamp", "end_timestamp", "open", "high", "low", "close", "volume")
+COMPACT_EVENT = "u"
+
+
+def encode_full(msg) -> dict:
+    return msg.__dict__
+
+
+def encode_compact(msg) -> list:
+    return [getattr(msg, field, None) for field in COMPACT_FIELDS]
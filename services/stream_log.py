@@ -0,0 +1,115 @@
+"""
+On-disk log of the Polygon aggregate stream, for replaying it later.
+
+The log is gzipped JSON lines. The first line is a header. Every other line
+is one batch as received from the websocket:
+
+    {"format": "polygon-agg", "version": 1, "keys": ["ev", "sym", ...], "started_at": 1700000000.0}
+    [offset_ms, [["AM", "AAPL", 1200, ...], ...]]
+
+`offset_ms` is the time since the recording started. Each row holds the
+message fields in `keys` order (Polygon's wire names), so a batch of many
+symbols costs little more than the numbers themselves.
+
+Recording is off unless POLYGON_RECORD_PATH is set (see polygon_proxy).
+`benchmarks/stream_replay.py` plays a log back through `handle_msg`.
+"""
+import atexit
+import gzip
+import json
+import logging
+import time
+
+from polygon.websocket.models import EquityAgg
+
+logger = logging.getLogger(__name__)
+
+FORMAT = "polygon-agg"
+VERSION = 1
+
+# Wire name -> EquityAgg attribute, in EquityAgg.from_dict order
+WIRE_FIELDS = (
+    ("ev", "event_type"), ("sym", "symbol"), ("v", "volume"), ("av", "accumulated_volume"),
+    ("op", "official_open_price"), ("vw", "vwap"), ("o", "open"), ("c", "close"),
+    ("h", "high"), ("l", "low"), ("a", "aggregate_vwap"), ("z", "average_size"),
+    ("s", "start_timestamp"), ("e", "end_timestamp"), ("otc", "otc"),
+)
+KEYS = [wire for wire, _ in WIRE_FIELDS]
+
+# Batches buffered by gzip before they are forced to disk
+FLUSH_EVERY = 100
+
+
+def encode_row(msg):
+    event_type = getattr(msg, "event_type", None)
+    return [
+        getattr(event_type, "value", event_type) if attr == "event_type" else getattr(msg, attr, None)
+        for _, attr in WIRE_FIELDS
+    ]
+
+
+def decode_row(keys, row):
+    return EquityAgg.from_dict(dict(zip(keys, row)))
+
+
+class StreamRecorder:
+    """
+    Appends websocket batches to a log. The file is created on the first
+    batch, so a process that never receives any leaves nothing behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.started = None
+        self.batches = 0
+        self._file = None
+        self._closed = False
+
+    def _open(self):
+        self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        header = {"format": FORMAT, "version": VERSION, "keys": KEYS, "started_at": time.time()}
+        self._file.write(json.dumps(header) + "\n")
+        self.started = time.monotonic()
+        # gzip only writes its trailer on close
+        atexit.register(self.close)
+        logger.info("Recording aggregates to %s", self.path)
+
+    def record(self, messages):
+        """
+        Append one websocket batch. Messages without a symbol are skipped.
+        """
+        if self._closed:
+            return
+        rows = [encode_row(m) for m in messages if getattr(m, "symbol", None)]
+        if not rows:
+            return
+        if self._file is None:
+            self._open()
+        offset_ms = int((time.monotonic() - self.started) * 1000)
+        self._file.write(json.dumps([offset_ms, rows], separators=(",", ":")) + "\n")
+        self.batches += 1
+        if self.batches % FLUSH_EVERY == 0:
+            self._file.flush()
+
+    def close(self):
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.info("Closed %s after %d batches", self.path, self.batches)
+
+
+def read_stream_log(path):
+    """
+    Yield `(offset_seconds, [EquityAgg, ...])` for every batch in the log.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != FORMAT:
+            raise ValueError(f"{path} is not a {FORMAT} log")
+        keys = header["keys"]
+        for line in f:
+            if not line.strip():
+                continue
+            offset_ms, rows = json.loads(line)
+            yield offset_ms / 1000, [decode_row(keys, row) for row in rows]
@@ -0,0 +1,57 @@
+"""
+Two-way index of live-update subscriptions (sid <-> symbol).
+
+Socket.IO rooms do the actual fan-out: each symbol has a room, so an update
+costs one emit however many clients watch it. This index mirrors the room
+membership so we can tell, without asking the Socket.IO manager, whether a
+symbol has any subscribers and which symbols a disconnecting sid held.
+"""
+
+
+def symbol_room(symbol: str, compact: bool = False) -> str:
+    return f"symbol:{symbol}:c" if compact else f"symbol:{symbol}"
+
+
+class SubscriptionIndex:
+    def __init__(self):
+        self.by_sid = {}      # sid -> set of symbols
+        self.by_symbol = {}   # symbol -> set of sids
+
+    def add(self, sid, symbol) -> bool:
+        """Record the subscription. True if `symbol` just got its first subscriber."""
+        self.by_sid.setdefault(sid, set()).add(symbol)
+        sids = self.by_symbol.setdefault(symbol, set())
+        first = not sids
+        sids.add(sid)
+        return first
+
+    def remove(self, sid, symbol) -> bool:
+        """Drop the subscription. True if `symbol` just lost its last subscriber."""
+        symbols = self.by_sid.get(sid)
+        if symbols is not None:
+            symbols.discard(symbol)
+            if not symbols:
+                del self.by_sid[sid]
+        sids = self.by_symbol.get(symbol)
+        if sids is None or sid not in sids:
+            return False
+        sids.discard(sid)
+        if not sids:
+            del self.by_symbol[symbol]
+            return True
+        return False
+
+    def remove_sid(self, sid) -> list:
+        """Drop every subscription of `sid`. Returns the symbols left with no subscribers."""
+        emptied = []
+        for symbol in list(self.by_sid.get(sid, ())):
+            if self.remove(sid, symbol):
+                emptied.append(symbol)
+        self.by_sid.pop(sid, None)
+        return emptied
+
+    def has_subscribers(self, symbol) -> bool:
+        return symbol in self.by_symbol
+
+    def subscribers(self, symbol) -> set:
+        return self.by_symbol.get(symbol, set())
@@ -0,0 +1,106 @@
+"""
+Reference-counted upstream subscriptions for the Polygon websocket.
+
+Each symbol's reference count is the set of sids watching it (kept in a
+`SubscriptionIndex`), so duplicate subscribes from one client count once.
+Channel changes are not sent one by one: they are collected and flushed
+together every `tick` seconds as a single `subscribe` and a single
+`unsubscribe` call. A symbol whose last watcher leaves stays subscribed for
+`grace` seconds, so page reloads and quick navigation back and forth don't
+churn the upstream channel set.
+"""
+import logging
+import time
+
+import gevent
+
+from services.subscription_index import SubscriptionIndex
+
+logger = logging.getLogger(__name__)
+
+
+def channel_for(symbol: str) -> str:
+    return f"AM.{symbol}"
+
+
+class SubscriptionManager:
+    def __init__(self, ws_client, tick=0.25, grace=30.0):
+        self.ws_client = ws_client
+        self.tick = tick
+        self.grace = grace
+        self.index = SubscriptionIndex()
+        self.active = set()            # symbols subscribed upstream
+        self._pending_release = {}     # symbol -> monotonic deadline
+        self._flush = None
+        self._flush_at = None
+
+    def refcount(self, symbol) -> int:
+        return len(self.index.subscribers(symbol))
+
+    def acquire(self, sid, symbol):
+        self.index.add(sid, symbol)
+        self._pending_release.pop(symbol, None)
+        if symbol not in self.active:
+            self._schedule(self.tick)
+
+    def release(self, sid, symbol):
+        if self.index.remove(sid, symbol):
+            self._release_later(symbol)
+
+    def release_all(self, sid):
+        for symbol in self.index.remove_sid(sid):
+            self._release_later(symbol)
+
+    def reset(self):
+        """
+        Forget every holder and upstream channel, e.g. once the websocket
+        they were sent on has been closed.
+        """
+        if self._flush is not None:
+            self._flush.kill(block=False)
+        self._flush = None
+        self._flush_at = None
+        self.index = SubscriptionIndex()
+        self.active.clear()
+        self._pending_release.clear()
+
+    def _release_later(self, symbol):
+        if symbol in self.active:
+            self._pending_release[symbol] = time.monotonic() + self.grace
+            self._schedule(self.grace)
+
+    def _schedule(self, delay):
+        due = time.monotonic() + delay
+        if self._flush is not None and not self._flush.dead:
+            if self._flush_at <= due:
+                return
+            self._flush.kill(block=False)
+        self._flush_at = due
+        self._flush = gevent.spawn_later(delay, self.flush)
+
+    def flush(self):
+        """
+        Send at most one subscribe and one unsubscribe frame for everything
+        that changed since the last flush.
+        """
+        self._flush = None
+        now = time.monotonic()
+        adds = [s for s in self.index.by_symbol if s not in self.active]
+        removes = [
+            s for s, due in self._pending_release.items()
+            if due <= now and not self.index.has_subscribers(s)
+        ]
+        for symbol in removes:
+            del self._pending_release[symbol]
+
+        if adds:
+            self.ws_client.subscribe(*(channel_for(s) for s in adds))
+            self.active.update(adds)
+            logger.info("Subscribed to Polygon channels: %s", ", ".join(adds))
+        if removes:
+            self.ws_client.unsubscribe(*(channel_for(s) for s in removes))
+            self.active.difference_update(removes)
+            logger.info("Unsubscribed from Polygon channels: %s", ", ".join(removes))
+
+        if self._pending_release:
+            self._schedule(max(min(self._pending_release.values()) - now, 0))
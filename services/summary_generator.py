@@ -1,43 +1,40 @@
-import requests, os
-import redis
-import pickle
-from cache.redis_client import redis_conn
+import logging
+import os
+import gevent
+from gevent.queue import Queue
+from cache.summary_cache import SummaryCache
+from services.llm_client import llm, LLMError, LLMUnavailable
+from services.metrics import timed
 from dotenv import load_dotenv, find_dotenv
-from redis.exceptions import ConnectionError as RedisConnectionError
-
-try:
-    redis_client = redis.Redis.from_url(os.getenv("REDIS_URL"), decode_responses=True)
-    redis_client.ping()
-except Exception as e:
-    print(f"[summary_generator] Redis unavailable during init: {e}")
-    redis_client = None
 
 load_dotenv(find_dotenv())
 
+logger = logging.getLogger(__name__)
+
+# Bump whenever the prompt or model changes so cached summaries are regenerated.
+PROMPT_VERSION = 1
+
+SUMMARY_MODEL = "anthropic/claude-3-opus"
+SUMMARY_PARAMS = {"temperature": 0.5, "max_tokens": 400}
+SUMMARY_HEADERS = {"Referer": "http://localhost", "HTTP-Referer": "http://localhost"}
+# Shown when no summary could be generated; never cached
+SUMMARY_UNAVAILABLE = ["Summary unavailable."]
+
+summary_cache = SummaryCache(
+    PROMPT_VERSION,
+    ttl=int(os.getenv("SUMMARY_TTL_SECONDS", str(7 * 24 * 3600))),
+)
+
+@timed("generate_ai_summary")
 def generate_ai_summary(info: dict, symbol) -> list:
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    cache_key = f"summary_{symbol}"
-    try:
-        cached_summary = redis_client.get(cache_key)
-    except RedisConnectionError as e:
-        print(f"[summary_generator] Redis connection unavailable for get: {e}")
-        cached_summary = None
-    if cached_summary:
-        print(f"[summary_generator] Loaded cached summary for {symbol}")
-        try:
-            summary = pickle.loads(cached_summary)
-            if summary and isinstance(summary, list):
-                return summary
-        except Exception:
-            print(f"⚠️ Failed to load cached summary for {symbol}, regenerating...")
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "Referer": "http://localhost",
-        "HTTP-Referer": "http://localhost"
-    }
+    """
+    Cached AI summary for `symbol`. Claude is only called when no summary
+    exists for this prompt version and these metrics (one call per key at a time).
+    """
+    summary = summary_cache.get_or_generate(symbol, info, lambda: request_ai_summary(info, symbol))
+    return summary or list(SUMMARY_UNAVAILABLE)
 
+def _summary_messages(info: dict):
     prompt = f"""
 You are a professional stock market analyst. Given the detailed stock information below, produce a short, clean bullet point summary (4–5 points) for an investor.
 
@@ -51,36 +48,94 @@ Always use bullet points, keep each under 2 lines. Do NOT add any other text.
 Here is the stock data:
 {info}
 """
+    return [{"role": "user", "content": prompt}]
+
+def _clean_bullet(line: str):
+    line = line.strip().strip("-• ").strip()
+    return line if line and len(line) < 250 else None
+
+def request_ai_summary(info: dict, symbol):
+    try:
+        text = llm.chat(
+            "summary", SUMMARY_MODEL, _summary_messages(info),
+            headers=SUMMARY_HEADERS, **SUMMARY_PARAMS,
+        )
+    except LLMUnavailable as e:
+        logger.warning("Skipping summary for %s: %s", symbol, e)
+        return None
+    except LLMError as e:
+        logger.warning("Claude summary generation failed for %s: %s", symbol, e)
+        return None
+
+    lines = [_clean_bullet(line) for line in text.strip().split("\n")]
+    summary_list = [line for line in lines if line]
+    if not summary_list:
+        logger.warning("AI returned empty or malformed summary list for %s", symbol)
+        return None
+
+    logger.info("Returning new summary for %s", symbol)
+    return summary_list
+
+def request_ai_summary_stream(info: dict, symbol, on_bullet):
+    """
+    Like `request_ai_summary`, but uses OpenRouter's streaming API and calls
+    `on_bullet(text)` as soon as each bullet line is complete.
+    """
+    summary_list = []
+    buffer = ""
 
-    data = {
-        "model": "anthropic/claude-3-opus",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.5,
-        "max_tokens": 400
-    }
+    def emit(line):
+        bullet = _clean_bullet(line)
+        if bullet:
+            summary_list.append(bullet)
+            on_bullet(bullet)
 
     try:
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        text = result["choices"][0]["message"]["content"]
-
-        lines = [line.strip("-• ").strip() for line in text.strip().split("\n")]
-        summary_list = [line for line in lines if line and len(line) < 250]
-        if not summary_list:
-            print(f"⚠️ AI returned empty or malformed summary list for {symbol}")
-            return ["Summary unavailable."]
-
-        try:
-            print(f"[summary_generator] Caching summary for {symbol}")
-            redis_client.set(cache_key, pickle.dumps(summary_list))
-        except RedisConnectionError as e:
-            print(f"[summary_generator] Redis connection unavailable for set: {e}")
-        print(f"[summary_generator] Returning new summary for {symbol}")
-        return summary_list
-    except requests.exceptions.HTTPError as err:
-        print(f"HTTP Error: {err.response.status_code} - {err.response.text}")
-    except Exception as e:
-        print(f"Claude summary generation failed for {symbol}: {e}")
-
-    return ["Summary unavailable."]
\ No newline at end of file
+        deltas = llm.stream_chat(
+            "summary_stream", SUMMARY_MODEL, _summary_messages(info),
+            headers=SUMMARY_HEADERS, **SUMMARY_PARAMS,
+        )
+        for delta in deltas:
+            buffer += delta
+            *complete, buffer = buffer.split("\n")
+            for line in complete:
+                emit(line)
+        emit(buffer)
+    except LLMUnavailable as e:
+        logger.warning("Skipping summary stream for %s: %s", symbol, e)
+        return None
+    except LLMError as e:
+        logger.warning("Claude summary stream failed for %s: %s", symbol, e)
+        return None
+
+    if not summary_list:
+        logger.warning("AI returned empty or malformed summary list for %s", symbol)
+        return None
+    return summary_list
+
+def stream_ai_summary(info: dict, symbol):
+    """
+    Yield summary bullets for `symbol` as they become available.
+
+    A cached summary is yielded at once. Otherwise the caller that wins the
+    per-key lock streams bullets from the model as they arrive, and the result
+    is cached at the end. Concurrent callers receive the finished list.
+    """
+    cached = summary_cache.peek(symbol, info)
+    if cached:
+        yield from cached
+        return
+
+    bullets = Queue()
+    job = gevent.spawn(
+        summary_cache.generate, symbol, info,
+        lambda: request_ai_summary_stream(info, symbol, bullets.put),
+    )
+    job.link(lambda _: bullets.put(StopIteration))
+    sent = 0
+    for bullet in bullets:
+        sent += 1
+        yield bullet
+    # Followers of another caller's generation get the whole list here.
+    result = job.value or SUMMARY_UNAVAILABLE
+    yield from result[sent:]
@@ -0,0 +1,225 @@
+"""
+In-memory symbol/name index for /api/stock/suggest.
+
+The index is built from a bulk snapshot of Polygon's reference tickers,
+which is stored in Redis so every worker can load it without calling Polygon.
+Lookups never leave the process:
+
+- symbols sit in a sorted list, and a prefix is one pair of `bisect` calls;
+- company-name tokens sit in a second sorted list, so "APP" finds Apple
+  through the token "APPLE".
+
+Results rank exact symbol matches first, then symbol prefixes, then name
+matches, and break ties within each tier by popularity.
+"""
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from bisect import bisect_left
+
+import gevent
+import requests
+from redis.exceptions import RedisError
+
+from cache.redis_client import redis_conn
+from services.polygon_client import polygon
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = "tickers:snapshot"
+BUILT_AT_KEY = "tickers:snapshot:built_at"
+BUILD_LOCK_KEY = "tickers:snapshot:lock"
+
+REFRESH_SECONDS = int(os.getenv("TICKER_INDEX_REFRESH_HOURS", "24")) * 3600
+CHECK_SECONDS = 600
+BUILD_LOCK_TTL = 600
+# How often a worker with no index checks for the snapshot another worker is building
+SNAPSHOT_POLL_SECONDS = 5
+
+# Deletes the build lock only if we still own it.
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_TOKEN_RE = re.compile(r"[A-Z0-9]+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.upper())
+
+
+class TickerIndex:
+    def __init__(self, entries, popularity=None):
+        """
+        `entries` is an iterable of `(symbol, name)`; `popularity` maps a
+        symbol to a score where higher ranks first.
+        """
+        entries = sorted({sym.upper(): name for sym, name in entries}.items())
+        self.symbols = [sym for sym, _ in entries]
+        self.names = [name for _, name in entries]
+        pairs = sorted(
+            (token, i)
+            for i, name in enumerate(self.names)
+            for token in set(tokenize(name))
+        )
+        self.tokens = [token for token, _ in pairs]
+        self.token_ids = [i for _, i in pairs]
+        self.popularity = popularity or {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @staticmethod
+    def _prefix_range(arr, prefix):
+        return bisect_left(arr, prefix), bisect_left(arr, prefix + "\uffff")
+
+    def _name_matches(self, words):
+        matched = None
+        for word in words:
+            lo, hi = self._prefix_range(self.tokens, word)
+            ids = set(self.token_ids[lo:hi])
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                return set()
+        return matched or set()
+
+    def search(self, query, limit=10):
+        q = query.strip().upper()
+        if not q:
+            return []
+        tiers = {}
+        lo, hi = self._prefix_range(self.symbols, q)
+        for i in range(lo, hi):
+            tiers[i] = 0 if self.symbols[i] == q else 1
+        for i in self._name_matches(tokenize(q)):
+            tiers.setdefault(i, 2)
+
+        pop = self.popularity
+        ranked = sorted(
+            tiers,
+            key=lambda i: (tiers[i], -pop.get(self.symbols[i], 0), len(self.symbols[i]), self.symbols[i]),
+        )
+        return [{"symbol": self.symbols[i], "name": self.names[i]} for i in ranked[:limit]]
+
+
+def fetch_reference_snapshot():
+    """
+    Download every active stock/ETF ticker, following `next_url` pages.
+    """
+    entries = polygon.results(
+        "/v3/reference/tickers",
+        {"market": "stocks", "active": "true", "limit": 1000},
+        endpoint="reference.tickers",
+        timeout=30,
+    )
+    return [(r.get("ticker", ""), r.get("name", "")) for r in entries if r.get("ticker")]
+
+
+class TickerIndexHolder:
+    """
+    Owns the live index: loads it from the Redis snapshot, and rebuilds the
+    snapshot from Polygon on a schedule (one worker at a time).
+    """
+
+    def __init__(self, redis_client=redis_conn):
+        self.redis = redis_client
+        self.index = None
+        self.built_at = 0.0
+        self.popularity = {}
+        self._refresher = None
+        self._release = None
+
+    def set_popularity(self, scores):
+        self.popularity = scores
+        if self.index is not None:
+            self.index.popularity = scores
+
+    def _load_snapshot(self):
+        pipe = self.redis.pipeline()
+        pipe.get(BUILT_AT_KEY)
+        pipe.get(SNAPSHOT_KEY)
+        built_at, raw = pipe.execute()
+        if raw is None:
+            return False
+        self.index = TickerIndex(json.loads(raw), self.popularity)
+        self.built_at = float(built_at or 0)
+        logger.info("Loaded %s tickers from snapshot", len(self.index))
+        return True
+
+    def _rebuild_snapshot(self):
+        token = uuid.uuid4().hex
+        if not self.redis.set(BUILD_LOCK_KEY, token, nx=True, ex=BUILD_LOCK_TTL):
+            return False
+        try:
+            entries = fetch_reference_snapshot()
+            pipe = self.redis.pipeline()
+            pipe.set(SNAPSHOT_KEY, json.dumps(entries))
+            pipe.set(BUILT_AT_KEY, time.time())
+            pipe.execute()
+            logger.info("Rebuilt snapshot with %s tickers", len(entries))
+            return True
+        finally:
+            # A build that outlived its lock must not delete the next holder's.
+            if self._release is None:
+                self._release = self.redis.register_script(_RELEASE_LOCK)
+            self._release(keys=[BUILD_LOCK_KEY], args=[token])
+
+    def _wait_for_snapshot(self, built_at):
+        """
+        Poll until the worker holding the build lock publishes a snapshot newer
+        than `built_at`, or gives up. Until then search falls back to Polygon.
+        """
+        deadline = time.monotonic() + BUILD_LOCK_TTL
+        while time.monotonic() < deadline:
+            gevent.sleep(SNAPSHOT_POLL_SECONDS)
+            if float(self.redis.get(BUILT_AT_KEY) or 0) > built_at:
+                return
+            if not self.redis.exists(BUILD_LOCK_KEY):
+                return
+
+    def refresh(self):
+        """
+        Load the shared snapshot if it is newer than the local index, and
+        rebuild it if it is missing or old. A worker with no index waits for
+        another worker's build instead of searching through Polygon meanwhile.
+        """
+        try:
+            built_at = float(self.redis.get(BUILT_AT_KEY) or 0)
+            if built_at > self.built_at:
+                # An old snapshot still beats calling Polygon while a new one is built
+                self._load_snapshot()
+            if time.time() - built_at >= REFRESH_SECONDS:
+                if not self._rebuild_snapshot() and self.index is None:
+                    self._wait_for_snapshot(built_at)
+                built_at = float(self.redis.get(BUILT_AT_KEY) or 0)
+                if built_at > self.built_at:
+                    self._load_snapshot()
+        except (RedisError, requests.RequestException, ValueError) as e:
+            logger.warning("Refresh failed: %s", e)
+
+    def _refresh_forever(self):
+        while True:
+            self.refresh()
+            gevent.sleep(CHECK_SECONDS)
+
+    def start(self):
+        if self._refresher is None:
+            self._refresher = gevent.spawn(self._refresh_forever)
+
+    def search(self, query, limit=10):
+        """
+        Return suggestions, or None while no index is loaded yet.
+        """
+        if self.index is None:
+            self.start()
+            return None
+        return self.index.search(query, limit)
+
+
+ticker_index = TickerIndexHolder()
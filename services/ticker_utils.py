@@ -1,19 +1,22 @@
-import os, requests
+import logging
 from dotenv import load_dotenv, find_dotenv
+from services.polygon_client import polygon
+from services.metrics import timed
+from services.ticker_index import ticker_index
 
 load_dotenv(find_dotenv())
-POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
+
+logger = logging.getLogger(__name__)
 
 def is_valid_symbol(symbol: str) -> bool:
     sym = symbol.upper()
     try:
-        url = f"https://api.polygon.io/v2/aggs/ticker/{sym}/prev"
-        resp = requests.get(url, params={"apiKey": POLYGON_API_KEY})
-        resp.raise_for_status()
-        if not resp.json().get("results"):
+        body = polygon.get_json(f"/v2/aggs/ticker/{sym}/prev", endpoint="aggs.prev")
+        if not body.get("results"):
             return False
     except Exception:
         return False
+    return True
 
 def get_overview_if_valid(symbol: str):
     """Return {'symbol': sym, 'name': name} if valid, else None."""
@@ -22,32 +25,35 @@ def get_overview_if_valid(symbol: str):
         return None
     # Fetch name via REST API
     try:
-        ref_url = f"https://api.polygon.io/v3/reference/tickers/{sym}"
-        res = requests.get(ref_url, params={"apiKey": POLYGON_API_KEY})
-        res.raise_for_status()
-        ref = res.json().get("results", {}) or {}
+        body = polygon.get_json(f"/v3/reference/tickers/{sym}", endpoint="reference.ticker")
+        ref = body.get("results", {}) or {}
         name = ref.get("name", "")
     except Exception:
         name = ""
     return {"symbol": sym, "name": name}
 
+@timed("get_ticker_suggestions")
 def get_ticker_suggestions(query: str, limit: int = 10):
     """
-    Return ticker symbol suggestions by prefix-match against REST API results.
+    Return ticker symbol suggestions from the in-memory ticker index, falling
+    back to Polygon's search API until the index has loaded.
     """
+    local = ticker_index.search(query, limit)
+    if local is not None:
+        return local
+
     q = query.upper()
     suggestions = []
     try:
-        resp = requests.get(
-            "https://api.polygon.io/v3/reference/tickers",
-            params={"search": q, "limit": limit, "apiKey": POLYGON_API_KEY}
-        )
-        resp.raise_for_status()
-        results = resp.json().get("results", [])
+        results = polygon.get_json(
+            "/v3/reference/tickers",
+            {"search": q, "limit": limit},
+            endpoint="reference.search",
+        ).get("results", [])
         for entry in results:
             sym = entry.get("ticker", "").upper()
             suggestions.append({"symbol": sym, "name": entry.get("name", "")})
     except Exception:
         pass
-    print("Returning suggestions:", suggestions)
+    logger.debug("Returning %d suggestions for %s", len(suggestions), q)
     return suggestions
\ No newline at end of file
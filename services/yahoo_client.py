@@ -1,16 +1,34 @@
+import logging
+import os
+import requests
 import yfinance as yf
+from services.metrics import observe
 
-def fetch_yahoo_quote_json(symbol: str) -> dict:
+logger = logging.getLogger(__name__)
+
+# JSON endpoint returning a `.info` mapping, used instead of scraping Yahoo,
+# e.g. "http://127.0.0.1:9103/info/{symbol}" for benchmarks/fake_upstreams.py
+YAHOO_INFO_URL = os.getenv("YAHOO_INFO_URL")
+
+def fetch_yf_info(symbol: str) -> dict:
     """
-    Fetches key overview metrics for a symbol via yfinance.
+    Fetches the raw yfinance `.info` mapping for a symbol (one scrape).
     """
     try:
-        tk = yf.Ticker(symbol)
-        info = tk.info or {}
+        with observe("yfinance", "info"):
+            if YAHOO_INFO_URL:
+                response = requests.get(YAHOO_INFO_URL.format(symbol=symbol), timeout=15)
+                response.raise_for_status()
+                return response.json() or {}
+            return yf.Ticker(symbol).info or {}
     except Exception as e:
-        print(f"[YahooClient] yfinance fetch failed for {symbol}: {e}")
+        logger.warning("yfinance fetch failed for %s: %s", symbol, e)
         return {}
 
+def map_yahoo_overview(info: dict) -> dict:
+    """
+    Maps a yfinance `.info` mapping onto the overview metrics shown in the UI.
+    """
     # Map the desired fields, defaulting to None
     return {
         "Previous Close": info.get("previousClose"),
@@ -28,4 +46,13 @@ def fetch_yahoo_quote_json(symbol: str) -> dict:
         "YTD Daily Total Return": info.get("ytdReturn"),
         "Beta (5Y Monthly)": info.get("beta"),
         "Expense Ratio (net)": info.get("expenseRatio"),
-    }
\ No newline at end of file
+    }
+
+def fetch_yahoo_quote_json(symbol: str) -> dict:
+    """
+    Fetches key overview metrics for a symbol via yfinance.
+    """
+    info = fetch_yf_info(symbol)
+    if not info:
+        return {}
+    return map_yahoo_overview(info)